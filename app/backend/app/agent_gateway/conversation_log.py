@@ -0,0 +1,285 @@
+"""
+Conversation Log
+================
+
+Append-only JSONL persistence for chat history.
+
+Every message is a single line appended to the log, so a chat turn costs
+O(1) I/O regardless of how much history is stored. The in-memory index is
+rebuilt by replaying the log at startup and kept current by tailing new
+lines (which also picks up appends made by other worker processes). A
+summary index for the history sidebar is maintained alongside it.
+
+A background thread periodically compacts the log, merging each
+conversation's append records into one ``put`` record.
+
+Record formats:
+    {"op": "append", "cid": "...", "msg": {...}}
+    {"op": "put", "cid": "...", "messages": [...], "base": 0, "mode": "...", "preview": "..."}
+    {"op": "trim", "cid": "...", "drop": 10}
+    {"op": "delete", "cid": "..."}
+
+``base`` counts messages already trimmed (archived) from the front, so
+``base + len(messages)`` is the conversation's version. A deleted
+conversation keeps its base as a tombstone. ``mode`` / ``preview`` carry the
+summary of conversations whose first messages were archived.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.agent_gateway.conversation_store import ConversationStore, LogTail, SummaryIndex, file_lock
+
+logger = logging.getLogger(__name__)
+
+
+def _dump_line(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class ConversationLog(ConversationStore):
+    """
+    Append-only conversation store backed by a JSONL file.
+
+    Args:
+        path: Log file path (e.g. ``data/conversations.jsonl``)
+        legacy_path: Old ``conversations.json`` snapshot to import on first run
+        compact_interval: Seconds between background compaction checks (0 disables)
+        compact_min_appends: Appends required before a compaction is worth doing
+    """
+
+    def __init__(
+        self,
+        path: str,
+        legacy_path: Optional[str] = None,
+        compact_interval: float = 60.0,
+        compact_min_appends: int = 500,
+    ):
+        self.path = path
+        self.compact_interval = compact_interval
+        self.compact_min_appends = compact_min_appends
+
+        self._lock = threading.RLock()
+        self._lock_path = path + ".lock"
+        self._conversations: Dict[str, List[dict]] = {}
+        self._bases: Dict[str, int] = {}
+        self._summaries = SummaryIndex()
+        self._tail = LogTail(path)
+        self._appends_since_compact = 0
+
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+
+        with self._lock:
+            self._sync()
+
+        logger.info(f"Conversation log ready: {len(self._conversations)} conversations from {path}")
+
+    # ==========================================
+    # Reads
+    # ==========================================
+
+    def get(self, cid: str) -> List[dict]:
+        """Return a copy of the messages stored for ``cid`` (empty if unknown)."""
+        with self._lock:
+            self._sync()
+            return list(self._conversations.get(cid, ()))
+
+    def version(self, cid: str) -> int:
+        with self._lock:
+            self._sync()
+            return self._bases.get(cid, 0) + len(self._conversations.get(cid, ()))
+
+    def get_since(self, cid: str, since: int = 0) -> Tuple[int, List[dict]]:
+        with self._lock:
+            self._sync()
+            msgs = self._conversations.get(cid, [])
+            base = self._bases.get(cid, 0)
+            return base + len(msgs), msgs[max(0, since - base):]
+
+    def items(self) -> List[Tuple[str, List[dict]]]:
+        """Return ``(cid, messages)`` pairs for every stored conversation."""
+        with self._lock:
+            self._sync()
+            return [(cid, list(msgs)) for cid, msgs in self._conversations.items()]
+
+    def iter_conversation_ids(self) -> Iterator[str]:
+        with self._lock:
+            self._sync()
+            ids = list(self._conversations.keys() | self._bases.keys())
+        yield from ids
+
+    def list_summaries(
+        self,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> List[dict]:
+        with self._lock:
+            self._sync()
+            return self._summaries.page(limit, before, mode)
+
+    # ==========================================
+    # Writes
+    # ==========================================
+
+    def append(self, cid: str, message: dict) -> None:
+        """Append one message to a conversation (single O(1) line write)."""
+        self.append_many([(cid, message)])
+
+    def append_many(self, records: List[Tuple[str, dict]]) -> None:
+        """Append a batch of messages with one write under one lock."""
+        self._write([{"op": "append", "cid": cid, "msg": msg} for cid, msg in records])
+
+    def delete(self, cid: str) -> List[dict]:
+        with self._lock, file_lock(self._lock_path):
+            self._sync()
+            removed = self._conversations.get(cid, [])
+            if removed:
+                self._write_locked([{"op": "delete", "cid": cid}])
+            return removed
+
+    def trim(self, cid: str, keep_last: int) -> List[dict]:
+        with self._lock, file_lock(self._lock_path):
+            self._sync()
+            msgs = self._conversations.get(cid, [])
+            drop = len(msgs) - max(0, keep_last)
+            if drop <= 0:
+                return []
+            # Holding the file lock: nobody can append between reading and trimming
+            removed = msgs[:drop]
+            self._write_locked([{"op": "trim", "cid": cid, "drop": drop}])
+            return removed
+
+    def compact(self) -> None:
+        """Rewrite the log as one ``put`` record per conversation."""
+        with self._lock, file_lock(self._lock_path):
+            self._sync()
+            tmp = self.path + ".compact"
+            with open(tmp, "wb") as f:
+                for cid in self._conversations.keys() | self._bases.keys():
+                    msgs = self._conversations.get(cid, [])
+                    base = self._bases.get(cid, 0)
+                    if msgs or base:
+                        record = {"op": "put", "cid": cid, "messages": msgs}
+                        if base:
+                            record["base"] = base
+                            summary = self._summaries.get(cid) or self._summaries.tombstone(cid)
+                            if summary:
+                                record["mode"] = summary["mode"]
+                                record["preview"] = summary["preview"]
+                        f.write(_dump_line(record))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._tail.mark_replaced()
+            self._appends_since_compact = 0
+
+        logger.info(f"Conversation log compacted ({len(self._conversations)} conversations)")
+
+    # ==========================================
+    # Background compaction
+    # ==========================================
+
+    def start_compactor(self) -> None:
+        """Start the background compaction thread (idempotent)."""
+        if self.compact_interval <= 0 or (self._compactor and self._compactor.is_alive()):
+            return
+        self._stop.clear()
+        self._compactor = threading.Thread(
+            target=self._compact_loop, name="conversation-log-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def close(self) -> None:
+        """Stop the compaction thread."""
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join(timeout=5)
+            self._compactor = None
+
+    def _compact_loop(self) -> None:
+        while not self._stop.wait(self.compact_interval):
+            if self._appends_since_compact < self.compact_min_appends:
+                continue
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Conversation log compaction failed: {e}")
+
+    # ==========================================
+    # Internals
+    # ==========================================
+
+    def _write(self, records: List[dict]) -> None:
+        with self._lock, file_lock(self._lock_path):
+            self._write_locked(records)
+
+    def _write_locked(self, records: List[dict]) -> None:
+        """Append records to the log (caller holds both locks)."""
+        with open(self.path, "ab") as f:
+            f.write(b"".join(_dump_line(r) for r in records))
+        # Apply through the log itself so in-memory state and file offset
+        # stay consistent with appends made by other processes.
+        self._sync()
+        self._appends_since_compact += len(records)
+
+    def _sync(self) -> None:
+        """Apply log lines written since the last sync (caller holds ``_lock``)."""
+        reset, lines = self._tail.read_new()
+        if reset:
+            # First load, or the log was compacted/replaced by another process
+            self._conversations = {}
+            self._bases = {}
+            self._summaries.clear()
+        for raw in lines:
+            self._apply(raw)
+
+    def _apply(self, raw: bytes) -> None:
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            logger.warning(f"Skipping corrupt conversation log line: {e}")
+            return
+
+        op = record.get("op")
+        cid = record.get("cid")
+        if op == "append":
+            self._conversations.setdefault(cid, []).append(record["msg"])
+            self._summaries.add_message(cid, record["msg"])
+        elif op == "put":
+            self._conversations[cid] = list(record.get("messages", []))
+            self._bases[cid] = record.get("base", 0)
+            self._summaries.put(cid, self._conversations[cid], self._bases[cid], record.get("mode"), record.get("preview"))
+        elif op == "trim":
+            drop = record.get("drop", 0)
+            self._conversations[cid] = self._conversations.get(cid, [])[drop:]
+            self._bases[cid] = self._bases.get(cid, 0) + drop
+        elif op == "delete":
+            # Keep the version counter as a tombstone base
+            self._bases[cid] = self._bases.get(cid, 0) + len(self._conversations.pop(cid, []))
+            self._summaries.remove(cid, tombstone=True)
+
+    def _import_legacy(self, legacy_path: str) -> None:
+        """Seed the log from the old whole-file ``conversations.json``."""
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading legacy conversations: {e}")
+            return
+
+        tmp = self.path + ".import"
+        with open(tmp, "wb") as f:
+            for cid, msgs in legacy.items():
+                if msgs:
+                    f.write(_dump_line({"op": "put", "cid": cid, "messages": msgs}))
+        os.replace(tmp, self.path)
+        logger.info(f"Imported {len(legacy)} conversations from {legacy_path}")
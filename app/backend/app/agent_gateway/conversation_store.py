@@ -0,0 +1,438 @@
+"""
+Conversation Store
+==================
+
+Pluggable persistence backends for chat history.
+
+Backends:
+- ``jsonl``: append-only JSONL log (single process or light multi-worker use)
+- ``sqlite``: SQLite in WAL mode, safe to share between several uvicorn workers
+- ``sharded``: one JSONL file per conversation with an mtime-validated LRU
+
+Pick one with ``CONVERSATION_BACKEND``; the gateway only talks to the
+``ConversationStore`` interface.
+"""
+
+import base64
+import bisect
+import datetime
+import json
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 60
+
+_SAFE_CID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}")
+_B64_PREFIX = "b64_"
+_MAX_NAME = 200
+
+
+def summary_cursor(summary: dict) -> str:
+    """Opaque pagination cursor pointing just after ``summary``."""
+    return f"{summary['timestamp']}|{summary['id']}"
+
+
+def parse_cursor(before: str) -> Tuple[str, str]:
+    """Split a cursor into ``(timestamp, id)``; a bare timestamp yields an empty id."""
+    ts, _, cid = before.partition("|")
+    return ts, cid
+
+
+def safe_filename(cid: str) -> str:
+    """Filesystem-safe, reversible file stem for a conversation id."""
+    if _SAFE_CID.fullmatch(cid) and not cid.startswith(_B64_PREFIX):
+        name = cid
+    else:
+        # Arbitrary client ids must never reach the filesystem verbatim
+        name = _B64_PREFIX + base64.urlsafe_b64encode(cid.encode("utf-8")).decode("ascii").rstrip("=")
+    if len(name) > _MAX_NAME:
+        raise ValueError("Conversation id too long")
+    return name
+
+
+def validate_record(cid: str, message: dict) -> None:
+    """
+    Reject a ``(cid, message)`` record that no backend could store.
+
+    Raises:
+        ValueError: bad conversation id or a message that isn't a JSON object
+    """
+    if not isinstance(cid, str) or not cid:
+        raise ValueError("Conversation id must be a non-empty string")
+    safe_filename(cid)
+    if not isinstance(message, dict):
+        raise ValueError("Message must be a JSON object")
+    try:
+        json.dumps(message, ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Message is not JSON serializable: {e}") from e
+
+
+def cid_from_filename(name: str) -> Optional[str]:
+    """Inverse of ``safe_filename`` (None for names it could not have produced)."""
+    if name.startswith(_B64_PREFIX):
+        raw = name[len(_B64_PREFIX):]
+        try:
+            return base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)).decode("utf-8")
+        except ValueError:
+            return None
+    return name
+
+
+@contextmanager
+def file_lock(path: str):
+    """Cross-process exclusive lock held on ``path`` (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as lf:
+        fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+
+class SummaryIndex:
+    """
+    In-memory conversation summaries, updated incrementally per append.
+
+    Summaries are kept in a list sorted by ``(timestamp, id)`` so a page of
+    the history sidebar is a bisect plus a short walk, independent of how
+    many conversations are stored.
+
+    Archived conversations leave a tombstone (mode, preview, count), so a
+    conversation revived by a new message keeps its original preview and
+    counts its archived messages, as the SQLite backend's summary row does.
+    """
+
+    def __init__(self):
+        self._summaries: Dict[str, dict] = {}
+        self._order: List[Tuple[str, str]] = []
+        self._tombstones: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    def clear(self) -> None:
+        self._summaries.clear()
+        self._order.clear()
+        self._tombstones.clear()
+
+    def get(self, cid: str) -> Optional[dict]:
+        return self._summaries.get(cid)
+
+    def add(self, cid: str, mode: Optional[str], preview: str, timestamp: Optional[str], count: int = 1) -> None:
+        """Record ``count`` appended messages; mode/preview only apply to new conversations."""
+        ts = timestamp or datetime.datetime.now().isoformat()
+        summary = self._summaries.get(cid)
+        if summary is None:
+            summary = self._tombstones.pop(cid, None) or {
+                "id": cid,
+                "mode": mode or "security",
+                "preview": (preview or "")[:PREVIEW_CHARS],
+                "timestamp": ts,
+                "message_count": 0,
+            }
+            self._summaries[cid] = summary
+        else:
+            self._unlink(summary)
+        summary["timestamp"] = ts
+        summary["message_count"] += count
+        bisect.insort(self._order, (ts, cid))
+
+    def add_message(self, cid: str, message: dict) -> None:
+        self.add(cid, message.get("mode"), message.get("content", ""), message.get("timestamp"))
+
+    def put(
+        self,
+        cid: str,
+        messages: List[dict],
+        base: int = 0,
+        mode: Optional[str] = None,
+        preview: Optional[str] = None,
+    ) -> None:
+        """
+        Replace a conversation's summary from its hot messages (``base`` = already archived).
+
+        ``mode`` / ``preview`` override the ones taken from the first hot
+        message (which is not the first message once the front was archived).
+        """
+        self.remove(cid)
+        self._tombstones.pop(cid, None)
+        first = messages[0] if messages else {}
+        mode = mode or first.get("mode")
+        preview = preview if preview is not None else first.get("content", "")
+        if messages:
+            self.add(cid, mode, preview, messages[-1].get("timestamp"), base + len(messages))
+        elif base:
+            self.add_tombstone(cid, mode, preview, base)
+
+    def remove(self, cid: str, tombstone: bool = False) -> None:
+        """Drop a summary; ``tombstone`` keeps it for when the conversation is revived."""
+        summary = self._summaries.pop(cid, None)
+        if summary is not None:
+            self._unlink(summary)
+            if tombstone:
+                self._tombstones[cid] = summary
+
+    def add_tombstone(self, cid: str, mode: Optional[str], preview: str, count: int) -> None:
+        """Restore an archived conversation's tombstone (log replay / compaction)."""
+        if cid not in self._summaries:
+            self._tombstones[cid] = {
+                "id": cid,
+                "mode": mode or "security",
+                "preview": (preview or "")[:PREVIEW_CHARS],
+                "timestamp": None,
+                "message_count": count,
+            }
+
+    def tombstone(self, cid: str) -> Optional[dict]:
+        return self._tombstones.get(cid)
+
+    def tombstones(self) -> List[dict]:
+        return [dict(t) for t in self._tombstones.values()]
+
+    def page(self, limit: Optional[int] = None, before: Optional[str] = None, mode: Optional[str] = None) -> List[dict]:
+        """Newest-first summaries older than cursor ``before``, optionally for one mode."""
+        end = bisect.bisect_left(self._order, parse_cursor(before)) if before else len(self._order)
+        out = []
+        for i in range(end - 1, -1, -1):
+            summary = self._summaries[self._order[i][1]]
+            if mode and summary["mode"] != mode:
+                continue
+            out.append(dict(summary))
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def _unlink(self, summary: dict) -> None:
+        key = (summary["timestamp"], summary["id"])
+        i = bisect.bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+
+
+class LogTail:
+    """
+    Incrementally read complete lines appended to a file.
+
+    Detects when the file was replaced (compaction) or truncated, in which
+    case the caller must rebuild its state from the returned lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.inode: Optional[int] = None
+
+    def read_new(self) -> Tuple[bool, List[bytes]]:
+        """Return ``(reset, lines)``; ``reset`` means the lines start from scratch."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.inode = None
+            self.offset = 0
+            return True, []
+
+        reset = False
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            reset = True
+            self.inode = st.st_ino
+            self.offset = 0
+
+        if st.st_size == self.offset:
+            return reset, []
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+
+        # Only consume complete lines; a partial trailing write is picked up later
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        return reset, [raw for raw in data[:end].splitlines() if raw.strip()]
+
+    def mark_replaced(self) -> None:
+        """Adopt a file this process just rewrote as fully read."""
+        st = os.stat(self.path)
+        self.inode = st.st_ino
+        self.offset = st.st_size
+
+
+class ConversationStore(ABC):
+    """Interface every conversation backend implements."""
+
+    @abstractmethod
+    def get(self, cid: str) -> List[dict]:
+        """Return the messages of one conversation (empty list if unknown)."""
+
+    @abstractmethod
+    def items(self) -> List[Tuple[str, List[dict]]]:
+        """Return ``(cid, messages)`` pairs for every stored conversation."""
+
+    @abstractmethod
+    def append(self, cid: str, message: dict) -> None:
+        """Append one message to a conversation, creating it if needed."""
+
+    def append_many(self, records: List[Tuple[str, dict]]) -> None:
+        """
+        Append several ``(cid, message)`` records as one group commit.
+
+        Backends should override this with a single write/transaction that
+        leaves nothing written on any error other than OSError: the
+        persistence writer retries such batches record by record.
+        """
+        for cid, message in records:
+            self.append(cid, message)
+
+    @abstractmethod
+    def delete(self, cid: str) -> List[dict]:
+        """
+        Move a whole conversation out of the hot store (retention/archival).
+
+        Drops its messages and hides its summary but keeps the version
+        counter, so a conversation that receives new messages later continues
+        where the archived part left off; its summary then comes back with
+        the original preview and a count that includes archived messages.
+
+        Returns:
+            The removed messages, oldest first (for archiving)
+        """
+
+    @abstractmethod
+    def trim(self, cid: str, keep_last: int) -> List[dict]:
+        """
+        Drop all but the newest ``keep_last`` messages of a conversation.
+
+        The version counter is unchanged, so absolute message indexes stay
+        valid for delta sync.
+
+        Returns:
+            The removed messages, oldest first (for archiving)
+        """
+
+    def compact(self) -> None:
+        """Reclaim space after deletes/trims (no-op where not needed)."""
+
+    def version(self, cid: str) -> int:
+        """
+        Version counter of a conversation (0 if unknown).
+
+        Increments on every append and never decreases; message ``i`` of the
+        list returned by ``get`` has absolute index ``version - len(messages) + i``.
+        """
+        return len(self.get(cid))
+
+    def get_since(self, cid: str, since: int = 0) -> Tuple[int, List[dict]]:
+        """
+        Return ``(version, messages)`` with only messages at absolute index >= ``since``.
+
+        The returned version always matches the returned messages, so it can
+        be used as the next ``since``.
+        """
+        msgs = self.get(cid)
+        return len(msgs), msgs[max(0, since):]
+
+    def iter_conversation_ids(self) -> Iterator[str]:
+        """
+        Yield every conversation id, including archived tombstones.
+
+        Backends should stream ids rather than materialise the whole store.
+        """
+        for cid, _ in self.items():
+            yield cid
+
+    def list_summaries(
+        self,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        List conversations with preview, newest first.
+
+        Args:
+            limit: Max summaries to return (None for all)
+            before: Cursor from ``summary_cursor``; only older conversations are returned
+            mode: Only conversations started in this mode
+
+        Backends should override this with a maintained index; the default
+        walks every message.
+        """
+        index = SummaryIndex()
+        for cid, msgs in self.items():
+            index.put(cid, msgs)
+        return index.page(limit, before, mode)
+
+    def close(self) -> None:
+        """Release background threads, connections and file handles."""
+
+
+def create_conversation_store(backend: str, data_dir: str, **options) -> ConversationStore:
+    """
+    Build the configured conversation backend.
+
+    Args:
+        backend: ``"jsonl"``, ``"sqlite"`` or ``"sharded"``
+        data_dir: Directory holding conversation data files
+        **options: Backend specific settings (compaction interval, DB path, cache size...)
+
+    Returns:
+        Ready-to-use ConversationStore
+    """
+    backend = (backend or "jsonl").lower()
+    log_file = os.path.join(data_dir, "conversations.jsonl")
+    legacy_file = os.path.join(data_dir, "conversations.json")
+
+    if backend == "jsonl":
+        from app.agent_gateway.conversation_log import ConversationLog
+
+        store = ConversationLog(
+            log_file,
+            legacy_path=legacy_file,
+            compact_interval=options.get("compact_interval", 60.0),
+            compact_min_appends=options.get("compact_min_appends", 500),
+        )
+        store.start_compactor()
+        return store
+
+    if backend == "sqlite":
+        from app.agent_gateway.sqlite_store import SqliteConversationStore
+
+        db_path = options.get("db_path") or os.path.join(data_dir, "conversations.db")
+        store = SqliteConversationStore(db_path)
+        if store.is_empty() and (os.path.exists(log_file) or os.path.exists(legacy_file)):
+            # One-time migration from the file based stores
+            from app.agent_gateway.conversation_log import ConversationLog
+
+            log = ConversationLog(log_file, legacy_path=legacy_file, compact_interval=0)
+            store.import_items(log.items())
+        return store
+
+    if backend == "sharded":
+        from app.agent_gateway.sharded_store import ShardedConversationStore
+
+        store = ShardedConversationStore(
+            os.path.join(data_dir, "conversations"),
+            cache_size=options.get("cache_size", 256),
+        )
+        if store.is_empty() and (os.path.exists(log_file) or os.path.exists(legacy_file)):
+            from app.agent_gateway.conversation_log import ConversationLog
+
+            log = ConversationLog(log_file, legacy_path=legacy_file, compact_interval=0)
+            store.import_items(log.items())
+        return store
+
+    raise ValueError(f"Unknown conversation backend: {backend}")
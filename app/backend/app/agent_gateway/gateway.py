@@ -1,9 +1,31 @@
+# Agent Gateway
+import asyncio
 import json
 import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 from app.agent_gateway.intent_router import detect_intent
 from app.agent_gateway.response_builder import build_reply
-from app.llm.llm_router import llm_explain
+from app.agent_gateway.conversation_store import create_conversation_store, file_lock, validate_record
+from app.agent_gateway.persistence_writer import PersistenceWriter
+from app.agent_gateway.retention import ConversationArchive, RetentionPolicy, enforce_retention
+from app.core.timing import StageTimer
+from app.core.config import (
+    SENTRI_DATA_DIR,
+    CONVERSATION_BACKEND,
+    CONVERSATION_DB_PATH,
+    CONVERSATION_CACHE_SIZE,
+    CONVERSATION_COMPACT_INTERVAL_S,
+    CONVERSATION_COMPACT_MIN_APPENDS,
+    PERSIST_QUEUE_SIZE,
+    PERSIST_BATCH_SIZE,
+    HISTORY_IMPORT_BATCH_SIZE,
+    HISTORY_IMPORT_MAX_LINE_BYTES,
+    CONVERSATION_MAX_AGE_DAYS,
+    CONVERSATION_MAX_COUNT,
+    CONVERSATION_MAX_MESSAGES,
+    CONVERSATION_RETENTION_INTERVAL_S,
+)
+from app.llm.llm_router import llm_explain_async, llm_explain_stream
 from app.llm.prompts import SEC_EXPLAIN
 # Security stub (keep your existing engines here)
 from app.tools.security.stub import security_stub_scan
@@ -11,129 +33,299 @@ from app.tools.security.stub import security_stub_scan
 # File-based persistence to avoid losing history on reload
 import os
 
-# Store data outside app/backend to prevent reload loops
-DATA_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../../data/conversations.json"))
-os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+# Store data outside app/backend to prevent reload loops (SENTRI_DATA_DIR overrides)
+DATA_DIR = os.path.abspath(SENTRI_DATA_DIR or os.path.join(os.path.dirname(__file__), "../../../../data"))
 
-def _load_conversations() -> Dict[str, list[dict]]:
-    if not os.path.exists(DATA_FILE):
-        return {}
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading conversations: {e}")
-        return {}
+# Pluggable backend: append-only JSONL log (default), SQLite/WAL or per-conversation shards
+_STORE = create_conversation_store(
+    CONVERSATION_BACKEND,
+    DATA_DIR,
+    db_path=CONVERSATION_DB_PATH,
+    cache_size=CONVERSATION_CACHE_SIZE,
+    compact_interval=CONVERSATION_COMPACT_INTERVAL_S,
+    compact_min_appends=CONVERSATION_COMPACT_MIN_APPENDS,
+)
+
+# Background group-commit writer: chat requests never block on file/DB I/O
+_WRITER = PersistenceWriter(_STORE, max_queue=PERSIST_QUEUE_SIZE, max_batch=PERSIST_BATCH_SIZE)
+
+# Cold conversations (and old parts of long ones) move to a gzip archive
+_ARCHIVE = ConversationArchive(os.path.join(DATA_DIR, "archive"))
+_RETENTION = RetentionPolicy(
+    max_age_days=CONVERSATION_MAX_AGE_DAYS,
+    max_conversations=CONVERSATION_MAX_COUNT,
+    max_messages=CONVERSATION_MAX_MESSAGES,
+)
+_retention_task: Optional[asyncio.Task] = None
+
+def run_retention() -> dict:
+    """Apply the retention policy once (one worker at a time)."""
+    with file_lock(os.path.join(DATA_DIR, "retention.lock")):
+        return enforce_retention(_STORE, _ARCHIVE, _RETENTION)
+
+async def _retention_loop():
+    while True:
+        await asyncio.sleep(CONVERSATION_RETENTION_INTERVAL_S)
+        try:
+            await asyncio.to_thread(run_retention)
+        except Exception as e:
+            print(f"Error applying conversation retention: {e}")
 
-def _save_conversations(data: Dict[str, list[dict]]):
+def start_persistence():
+    """Start the background writer and retention task on the running event loop."""
+    global _retention_task
+    _WRITER.start()
+    if _RETENTION.enabled and CONVERSATION_RETENTION_INTERVAL_S > 0:
+        _retention_task = asyncio.get_running_loop().create_task(_retention_loop())
+
+async def stop_persistence():
+    """Flush queued messages and release the store."""
+    global _retention_task
+    if _retention_task:
+        _retention_task.cancel()
+        _retention_task = None
+    await _WRITER.stop()
+    _STORE.close()
+
+async def _append_message(cid: str, role: str, content: str, mode: str, ts: Optional[str] = None) -> Optional[asyncio.Future]:
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        return await _WRITER.submit(cid, {
+            "role": role,
+            "content": content,
+            "mode": mode,
+            "timestamp": ts or datetime.datetime.now().isoformat()
+        })
     except Exception as e:
-        print(f"Error saving conversations: {e}")
-
-# Load initially
-_CONV: Dict[str, list[dict]] = _load_conversations()
-
-def _get_conv(cid: str) -> list[dict]:
-    # Always reload to ensure multi-process sync (simple approach)
-    global _CONV
-    _CONV = _load_conversations()
-    return _CONV.setdefault(cid, [])
-
-def _save_conv(cid: str, messages: list[dict]):
-    global _CONV
-    _CONV[cid] = messages
-    _save_conversations(_CONV)
-
-def list_conversations() -> list[dict]:
-    """List all conversations with preview."""
-    # Reload to get latest
-    global _CONV
-    _CONV = _load_conversations()
-    
-    out = []
-    for cid, msgs in _CONV.items():
-        if not msgs:
+        print(f"Error saving conversation: {e}")
+        return None
+
+async def _wait_persisted(*futures: Optional[asyncio.Future]):
+    for fut in futures:
+        if fut is None:
             continue
-        first = msgs[0]
-        last = msgs[-1]
-        out.append({
-            "id": cid,
-            "mode": first.get("mode", "security"),
-            "preview": first.get("content", "")[:60],
-            "timestamp": last.get("timestamp", datetime.datetime.now().isoformat()),
-            "message_count": len(msgs)
-        })
-    # Sort by timestamp desc
-    return sorted(out, key=lambda x: x["timestamp"], reverse=True)
+        try:
+            await fut
+        except Exception as e:
+            print(f"Error saving conversation: {e}")
+
+def list_conversations(limit: Optional[int] = None, before: Optional[str] = None, mode: Optional[str] = None) -> list[dict]:
+    """List conversations with preview, newest first (served from the summary index)."""
+    return _STORE.list_summaries(limit=limit, before=before, mode=mode)
 
 def get_conversation(cid: str) -> list[dict]:
-    """Get full conversation history."""
-    # Reload for latest
-    global _CONV
-    _CONV = _load_conversations()
-    return _CONV.get(cid, [])
-
-def handle_chat(conversation_id: str, mode: str, message: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    intent = detect_intent(mode, message)
+    """Get full conversation history, including archived messages."""
+    return get_conversation_delta(cid)[1]
+
+def get_conversation_version(cid: str) -> int:
+    """Version counter of a conversation (0 if it does not exist)."""
+    version = _STORE.version(cid)
+    if not version:
+        # Cold path: conversation was archived whole
+        version = len(_ARCHIVE.get(cid))
+    return version
+
+def get_conversation_delta(cid: str, since: Optional[str] = None) -> Tuple[int, list[dict]]:
+    """
+    Messages added after ``since`` plus the matching version.
+
+    ``since`` is either a message index (e.g. the previous ``version``) or an
+    ISO timestamp; ``None`` returns the whole conversation.
+    """
+    if since is None or since.isdigit():
+        start = int(since or 0)
+        version, msgs = _STORE.get_since(cid, start)
+        if not version:
+            archived = _ARCHIVE.get(cid)
+            return len(archived), archived[start:]
+        base = version - len(msgs) if msgs else version
+        if start < base:
+            # Older messages were trimmed from the hot store into the archive
+            msgs = _ARCHIVE.get(cid)[start:base] + msgs
+        return version, msgs
+    version, msgs = get_conversation_delta(cid)
+    return version, [m for m in msgs if (m.get("timestamp") or "") > since]
+
+def export_history() -> Iterator[bytes]:
+    """
+    Stream every stored message as NDJSON, one message per line.
+
+    Conversations are read one at a time (archived part first), so memory
+    stays flat however large the history is. Each line carries
+    ``conversation_id`` and the absolute message index ``seq``.
+    """
+    for cid in _STORE.iter_conversation_ids():
+        yield from _export_conversation(cid)
+    # Conversations archived whole are unknown to stores that drop tombstones
+    for cid in _ARCHIVE.iter_ids():
+        if not _STORE.version(cid):
+            yield from _export_conversation(cid)
+
+def _export_conversation(cid: str) -> Iterator[bytes]:
+    _, msgs = get_conversation_delta(cid)
+    lines = [
+        json.dumps({"conversation_id": cid, "seq": seq, **msg}, ensure_ascii=False) + "\n"
+        for seq, msg in enumerate(msgs)
+    ]
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Split a byte stream into ``(line_no, line)``; oversized lines come back as ``None``."""
+    buf = b""
+    line_no = 0
+    skipping = False
+    async for chunk in chunks:
+        buf += chunk
+        while True:
+            nl = buf.find(b"\n")
+            if nl < 0:
+                break
+            line, buf = buf[:nl], buf[nl + 1:]
+            line_no += 1
+            if skipping:
+                skipping = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        if len(buf) > HISTORY_IMPORT_MAX_LINE_BYTES:
+            # Drop the rest of this line instead of buffering it
+            skipping = True
+            buf = b""
+    if skipping:
+        yield line_no + 1, None
+    elif buf.strip():
+        yield line_no + 1, buf
+
+def _parse_import_line(line: bytes) -> Tuple[str, dict]:
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    cid = record.pop("conversation_id", None)
+    if not isinstance(cid, str) or not cid:
+        raise ValueError("missing conversation_id")
+    if record.get("role") not in ("user", "assistant"):
+        raise ValueError("role must be 'user' or 'assistant'")
+    if not isinstance(record.get("content"), str):
+        raise ValueError("content must be a string")
+    record.pop("seq", None)  # Position is assigned by the target store
+    record.setdefault("mode", "security")
+    record.setdefault("timestamp", datetime.datetime.now().isoformat())
+    validate_record(cid, record)
+    return cid, record
+
+async def import_history(chunks: AsyncIterator[bytes], max_errors: int = 20) -> Dict[str, Any]:
+    """
+    Append NDJSON messages (the ``export_history`` format) to the store.
+
+    The body is parsed as it arrives and written in batches of
+    ``HISTORY_IMPORT_BATCH_SIZE`` messages, one ``append_many`` transaction
+    each. Messages are appended to existing conversations, so importing the
+    same file twice duplicates them. Invalid lines are skipped and reported.
+    """
+    imported = 0
+    errors: list[dict] = []
+    skipped = 0
+    batch: list[Tuple[str, dict]] = []
+
+    async for line_no, line in _ndjson_lines(chunks):
+        try:
+            if line is None:
+                raise ValueError("line too long")
+            batch.append(_parse_import_line(line))
+        except ValueError as e:
+            skipped += 1
+            if len(errors) < max_errors:
+                errors.append({"line": line_no, "error": str(e)})
+            continue
+        if len(batch) >= HISTORY_IMPORT_BATCH_SIZE:
+            await asyncio.to_thread(_STORE.append_many, batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        await asyncio.to_thread(_STORE.append_many, batch)
+        imported += len(batch)
+    return {"imported": imported, "skipped": skipped, "errors": errors}
+
+_SCAN_INTENTS = ("scan_link", "scan_email", "scan_logs")
+
+def _explain_args(message: str, tool_result: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    return {
+        "user_message": message if tool_result is None else "Explain the scan result and next steps.",
+        "system_extra": SEC_EXPLAIN,
+        "context_json": json.dumps(tool_result or {}, ensure_ascii=False),
+    }
+
+async def handle_chat(conversation_id: str, mode: str, message: str, context: Optional[Dict[str, Any]] = None, fast: bool = False) -> Dict[str, Any]:
+    timer = StageTimer()
+    with timer.stage("intent"):
+        intent = detect_intent(mode, message)
     tool_result = None
     ts = datetime.datetime.now().isoformat()
 
-    # Load and append user message
-    messages = _get_conv(conversation_id)
-    messages.append({
-        "role": "user", 
-        "content": message, 
-        "mode": mode,
-        "timestamp": ts
-    })
-    _save_conv(conversation_id, messages)
+    # Queue user message; the background writer group-commits it with other chats
+    user_saved = await _append_message(conversation_id, "user", message, mode, ts)
 
     if mode == "security":
-        if intent in ("scan_link", "scan_email", "scan_logs"):
-            tool_result = security_stub_scan(intent=intent, text=message)
+        if intent in _SCAN_INTENTS:
+            with timer.stage("tool"):
+                tool_result = security_stub_scan(intent=intent, text=message)
 
-        system_extra = SEC_EXPLAIN
-        llm_reply = llm_explain(
-            user_message=message if tool_result is None else "Explain the scan result and next steps.",
-            system_extra=system_extra,
-            context_json=json.dumps(tool_result or {}, ensure_ascii=False)
-        )
-        
-        # Reload to minimize race conditions, then append reply
-        messages = _get_conv(conversation_id)
-        messages.append({
-            "role": "assistant", 
-            "content": llm_reply, 
-            "mode": mode,
-            "timestamp": datetime.datetime.now().isoformat()
-        })
-        _save_conv(conversation_id, messages)
-        
-        return build_reply(intent, tool_result, llm_reply)
+        with timer.stage("llm"):
+            llm_reply = await llm_explain_async(
+                **_explain_args(message, tool_result), fast=fast, intent=intent, batch_key=conversation_id
+            )
 
     # Automotive mode removed
-    if mode == "automotive":
+    elif mode == "automotive":
         llm_reply = "Sentri: Automotive mode is currently disabled."
-        messages = _get_conv(conversation_id)
-        messages.append({
-            "role": "assistant", 
-            "content": llm_reply, 
-            "mode": mode,
-            "timestamp": datetime.datetime.now().isoformat()
-        })
-        _save_conv(conversation_id, messages)
-        return build_reply(intent, tool_result, llm_reply)
 
     # fallback
-    llm_reply = "Sentri: Unsupported mode."
-    messages = _get_conv(conversation_id)
-    messages.append({
-        "role": "assistant", 
-        "content": llm_reply, 
-        "mode": mode,
-        "timestamp": datetime.datetime.now().isoformat()
-    })
-    _save_conv(conversation_id, messages)
-    return build_reply(intent, tool_result, llm_reply)
+    else:
+        llm_reply = "Sentri: Unsupported mode."
+
+    with timer.stage("persist"):
+        reply_saved = await _append_message(conversation_id, "assistant", llm_reply, mode)
+        # Reply only once both messages are written so a following history read sees them
+        await _wait_persisted(user_saved, reply_saved)
+    reply = build_reply(intent, tool_result, llm_reply)
+    reply["server_timing"] = timer.server_timing()
+    return reply
+
+async def handle_chat_stream(conversation_id: str, mode: str, message: str, context: Optional[Dict[str, Any]] = None, fast: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming handle_chat: yields ``(event, data)`` pairs.
+
+    ``tool`` (intent and scan result) comes first, then one ``token`` per
+    reply delta, then ``done`` once the full reply is persisted. A client
+    that disconnects mid-stream leaves only its user message in history.
+    """
+    timer = StageTimer()
+    with timer.stage("intent"):
+        intent = detect_intent(mode, message)
+    tool_result = None
+    ts = datetime.datetime.now().isoformat()
+
+    user_saved = await _append_message(conversation_id, "user", message, mode, ts)
+
+    if mode == "security" and intent in _SCAN_INTENTS:
+        with timer.stage("tool"):
+            tool_result = security_stub_scan(intent=intent, text=message)
+
+    yield "tool", {"conversation_id": conversation_id, "mode": mode, "intent": intent, "tool_result": tool_result}
+
+    if mode == "security":
+        parts = []
+        with timer.stage("llm"):
+            async for delta in llm_explain_stream(**_explain_args(message, tool_result), fast=fast, intent=intent):
+                parts.append(delta)
+                yield "token", {"text": delta}
+        llm_reply = "".join(parts)
+    else:
+        llm_reply = "Sentri: Automotive mode is currently disabled." if mode == "automotive" else "Sentri: Unsupported mode."
+        yield "token", {"text": llm_reply}
+
+    with timer.stage("persist"):
+        reply_saved = await _append_message(conversation_id, "assistant", llm_reply, mode)
+        await _wait_persisted(user_saved, reply_saved)
+    yield "done", {**build_reply(intent, tool_result, llm_reply), "conversation_id": conversation_id, "server_timing": timer.server_timing()}
@@ -0,0 +1,128 @@
+"""
+Persistence Writer
+==================
+
+Background writer that moves conversation appends off the request path.
+
+Requests enqueue ``(cid, message)`` records on a bounded asyncio queue and
+get a future back. A single worker task drains whatever has accumulated
+and flushes it with one ``append_many`` call in a worker thread (group
+commit), so many concurrent chats share one write/transaction instead of
+each holding a threadpool thread for its own file I/O. A full queue
+applies backpressure to producers.
+
+Records are validated on ``submit``. If a batch still fails with a
+record-level error, each of its records is retried on its own so only the
+bad one fails (stores raise those before writing anything, so the retry
+cannot duplicate messages); I/O errors (disk full...) fail the whole batch.
+"""
+
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from app.agent_gateway.conversation_store import ConversationStore, validate_record
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceWriter:
+    """
+    Bounded, batching writer in front of a ConversationStore.
+
+    Args:
+        store: Backend that receives the batched appends
+        max_queue: Pending records before ``submit`` starts waiting
+        max_batch: Max records flushed in one ``append_many`` call
+    """
+
+    def __init__(self, store: ConversationStore, max_queue: int = 1000, max_batch: int = 256):
+        self.store = store
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(self, cid: str, message: dict) -> asyncio.Future:
+        """
+        Queue one message for persistence.
+
+        Returns:
+            Future resolved once the message is durably written (or failed)
+
+        Raises:
+            ValueError: the record can never be stored (nothing is queued)
+        """
+        validate_record(cid, message)
+        self._ensure_started()
+        fut = self._loop.create_future()
+        await self._queue.put((cid, message, fut))
+        return fut
+
+    def start(self) -> None:
+        """Start the worker on the running event loop (idempotent)."""
+        self._ensure_started()
+
+    async def stop(self) -> None:
+        """Flush everything queued, then stop the worker."""
+        if not self._task or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task and not self._task.done() and self._loop is loop:
+            return
+        # First use, or a new event loop (e.g. test clients / reloads)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = loop.create_task(self._run(), name="conversation-persistence-writer")
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # Group commit: everything that queued up during the last flush goes together
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, dict, asyncio.Future]]) -> None:
+        records = [(cid, msg) for cid, msg, _ in batch]
+        try:
+            await asyncio.to_thread(self.store.append_many, records)
+            errors: List[Optional[Exception]] = [None] * len(batch)
+        except OSError as e:
+            logger.error(f"Conversation flush failed ({len(batch)} messages): {e}")
+            errors = [e] * len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Conversation flush failed (1 message): {e}")
+                errors = [e]
+            else:
+                # One bad record must not fail the unrelated chats it was batched with
+                logger.warning(f"Conversation flush failed ({len(batch)} messages), retrying one by one: {e}")
+                errors = [await self._append_one(cid, msg) for cid, msg, _ in batch]
+
+        for (_, _, fut), error in zip(batch, errors):
+            if not fut.done():
+                if error is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(error)
+            self._queue.task_done()
+
+    async def _append_one(self, cid: str, message: dict) -> Optional[Exception]:
+        try:
+            await asyncio.to_thread(self.store.append_many, [(cid, message)])
+            return None
+        except Exception as e:
+            logger.error(f"Conversation append failed for {cid!r}: {e}")
+            return e
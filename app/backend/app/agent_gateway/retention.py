@@ -0,0 +1,184 @@
+"""
+Conversation Retention
+======================
+
+Keeps the hot conversation store small.
+
+- Conversations idle longer than ``max_age_days`` or beyond the newest
+  ``max_conversations`` are moved whole into a compressed archive.
+- Conversations longer than ``max_messages`` keep only their newest
+  messages hot; the older ones are appended to the archive.
+
+The archive holds one gzip JSONL file per conversation
+(``data/archive/<cid>.jsonl.gz``). Appends add a new gzip member, which
+readers decompress transparently, so archiving never rewrites old data.
+
+Messages are written (and fsynced) to the archive before they leave the
+hot store, so a failed archive write loses nothing and readers never see
+a gap. Archive appends are keyed by absolute message index: if the drop
+fails after the archive write, the next pass skips what is already
+archived instead of archiving it twice.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+
+from app.agent_gateway.conversation_store import ConversationStore, cid_from_filename, safe_filename
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".jsonl.gz"
+
+
+@dataclass
+class RetentionPolicy:
+    """Retention limits; 0 disables a limit."""
+    max_age_days: float = 0
+    max_conversations: int = 0
+    max_messages: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age_days or self.max_conversations or self.max_messages)
+
+
+class ConversationArchive:
+    """
+    Compressed cold storage for archived conversations.
+
+    Args:
+        directory: Folder holding ``<cid>.jsonl.gz`` files
+        compresslevel: gzip level (cold data, so favour size)
+    """
+
+    def __init__(self, directory: str, compresslevel: int = 6):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, cid: str, messages: List[dict], start: Optional[int] = None) -> None:
+        """
+        Durably append messages to a conversation's archive (oldest first).
+
+        With ``start`` (the absolute index of ``messages[0]``), messages the
+        archive already holds are skipped, so archiving them again is a no-op.
+        """
+        with self._lock:
+            if start is not None:
+                messages = messages[max(0, self.count(cid) - start):]
+            if not messages:
+                return
+            self._write(cid, messages)
+
+    def _write(self, cid: str, messages: List[dict]) -> None:
+        """Add one fsynced gzip member (caller holds ``_lock``)."""
+        data = "".join(json.dumps(m, ensure_ascii=False, separators=(",", ":")) + "\n" for m in messages)
+        with open(self._path(cid), "ab") as raw:
+            size = raw.tell()
+            try:
+                with gzip.GzipFile(fileobj=raw, mode="ab", compresslevel=self.compresslevel) as f:
+                    f.write(data.encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+            except BaseException:
+                # Drop the partial gzip member so the archive stays readable
+                raw.truncate(size)
+                raise
+
+    def get(self, cid: str) -> List[dict]:
+        """All archived messages of a conversation (empty if none)."""
+        try:
+            with gzip.open(self._path(cid), "rb") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def count(self, cid: str) -> int:
+        """Number of archived messages, i.e. the absolute index the archive ends at."""
+        try:
+            with gzip.open(self._path(cid), "rb") as f:
+                return sum(1 for line in f if line.strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def iter_ids(self) -> Iterator[str]:
+        """Yield the id of every archived conversation."""
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(_SUFFIX):
+                    cid = cid_from_filename(entry.name[: -len(_SUFFIX)])
+                    if cid is not None:
+                        yield cid
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.directory, safe_filename(cid) + _SUFFIX)
+
+
+def _archive_then_drop(
+    archive: ConversationArchive, cid: str, base: int, messages: List[dict], drop: Callable[[], List[dict]]
+) -> List[dict]:
+    """
+    Archive ``messages`` (the oldest hot ones, from absolute index ``base``),
+    then remove them from the hot store with ``drop``.
+
+    Messages appended between the read and the drop are removed too; they
+    are archived right after.
+    """
+    archive.append(cid, messages, base)
+    removed = drop()
+    archive.append(cid, removed, base)
+    return removed
+
+
+def enforce_retention(
+    store: ConversationStore,
+    archive: ConversationArchive,
+    policy: RetentionPolicy,
+    now: Optional[datetime.datetime] = None,
+) -> dict:
+    """
+    Apply ``policy`` once: archive cold conversations and trim long ones.
+
+    Returns:
+        Counts of archived conversations and trimmed messages
+    """
+    stats = {"archived_conversations": 0, "trimmed_messages": 0}
+    if not policy.enabled:
+        return stats
+
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=policy.max_age_days)).isoformat() if policy.max_age_days else None
+
+    for i, summary in enumerate(store.list_summaries()):
+        cid = summary["id"]
+        too_many = policy.max_conversations and i >= policy.max_conversations
+        too_old = cutoff is not None and summary["timestamp"] < cutoff
+
+        if too_many or too_old:
+            version, hot = store.get_since(cid)
+            _archive_then_drop(archive, cid, version - len(hot), hot, lambda: store.delete(cid))
+            stats["archived_conversations"] += 1
+        elif policy.max_messages and summary["message_count"] > policy.max_messages:
+            # message_count includes already archived messages, there is nothing to trim then
+            version, hot = store.get_since(cid)
+            drop = hot[: max(0, len(hot) - policy.max_messages)]
+            if drop:
+                removed = _archive_then_drop(
+                    archive, cid, version - len(hot), drop, lambda: store.trim(cid, policy.max_messages)
+                )
+                stats["trimmed_messages"] += len(removed)
+
+    if stats["archived_conversations"] or stats["trimmed_messages"]:
+        store.compact()
+        logger.info(
+            f"Retention: archived {stats['archived_conversations']} conversations, "
+            f"trimmed {stats['trimmed_messages']} messages"
+        )
+    return stats
@@ -0,0 +1,409 @@
+"""
+Sharded Conversation Store
+==========================
+
+One JSONL file per conversation (``data/conversations/<cid>.jsonl``).
+
+- ``append`` is a single ``O_APPEND`` write to one small file.
+- ``get`` only touches the requested conversation's file. Parsed
+  conversations live in a bounded per-worker LRU that is validated
+  against the file's inode/mtime/size, so unchanged files are never
+  re-parsed and files that only grew are read from the cached offset.
+- The history list is served from a summary index fed by a small shared
+  ``_summaries.log`` (one record per append), tailed by every worker and
+  compacted once it outgrows the number of conversations.
+- A trimmed shard starts with a ``{"_base": n}`` header line recording how
+  many messages were archived from its front.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.agent_gateway.conversation_store import (
+    ConversationStore,
+    LogTail,
+    SummaryIndex,
+    cid_from_filename,
+    fcntl,
+    file_lock,
+    safe_filename,
+)
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".jsonl"
+_SUMMARY_LOG = "_summaries.log"
+_BASE_KEY = "_base"
+
+
+def _dump_line(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _summary_record(cid: str, first: dict, last: dict, count: int = 1) -> dict:
+    record = {"cid": cid, "mode": first.get("mode"), "preview": (first.get("content") or "")[:60], "ts": last.get("timestamp")}
+    if count != 1:
+        record["n"] = count
+    return record
+
+
+class _CacheEntry:
+    __slots__ = ("inode", "mtime_ns", "size", "base", "messages")
+
+    def __init__(self, inode: int, mtime_ns: int, size: int, base: int, messages: List[dict]):
+        self.inode = inode
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.base = base
+        self.messages = messages
+
+
+class ShardedConversationStore(ConversationStore):
+    """
+    Conversation store with one append-only file per conversation.
+
+    Args:
+        directory: Folder holding ``<cid>.jsonl`` shards
+        cache_size: Max parsed conversations kept in memory per worker
+    """
+
+    def __init__(self, directory: str, cache_size: int = 256):
+        self.directory = directory
+        self.cache_size = max(0, cache_size)
+
+        self._cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._summary_path = os.path.join(directory, _SUMMARY_LOG)
+        self._summary_lock_path = self._summary_path + ".lock"
+        self._summaries = SummaryIndex()
+        self._summary_tail = LogTail(self._summary_path)
+        self._summary_records = 0
+
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self._summary_path) and not self.is_empty():
+            self._rebuild_summaries()
+        logger.info(f"Sharded conversation store ready at {directory} (cache={self.cache_size})")
+
+    # ==========================================
+    # Reads
+    # ==========================================
+
+    def get(self, cid: str) -> List[dict]:
+        return self._load(cid)[1]
+
+    def version(self, cid: str) -> int:
+        base, messages = self._load(cid)
+        return base + len(messages)
+
+    def get_since(self, cid: str, since: int = 0) -> Tuple[int, List[dict]]:
+        base, messages = self._load(cid)
+        return base + len(messages), messages[max(0, since - base):]
+
+    def items(self) -> List[Tuple[str, List[dict]]]:
+        return [(cid, self.get(cid)) for cid in self.conversation_ids()]
+
+    def conversation_ids(self) -> List[str]:
+        return list(self.iter_conversation_ids())
+
+    def iter_conversation_ids(self) -> Iterator[str]:
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(_SUFFIX):
+                    continue
+                cid = cid_from_filename(entry.name[: -len(_SUFFIX)])
+                if cid is not None:
+                    yield cid
+
+    def list_summaries(
+        self,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> List[dict]:
+        with self._lock:
+            self._sync_summaries()
+            return self._summaries.page(limit, before, mode)
+
+    def is_empty(self) -> bool:
+        return not any(name.endswith(_SUFFIX) for name in os.listdir(self.directory))
+
+    # ==========================================
+    # Writes
+    # ==========================================
+
+    def append(self, cid: str, message: dict) -> None:
+        self.append_many([(cid, message)])
+
+    def append_many(self, records: List[Tuple[str, dict]]) -> None:
+        """One write per touched shard plus one summary write for the whole batch."""
+        grouped: "OrderedDict[str, List[dict]]" = OrderedDict()
+        for cid, message in records:
+            grouped.setdefault(cid, []).append(message)
+
+        # Every path and line up front: an invalid id or an unserializable message
+        # fails the batch before anything is written, so only OSError can leave
+        # it half-written (the writer retries other errors record by record)
+        shards = [
+            (
+                cid,
+                messages,
+                self._path(cid),
+                b"".join(_dump_line(m) for m in messages),
+                _summary_record(cid, messages[0], messages[-1], len(messages)),
+            )
+            for cid, messages in grouped.items()
+        ]
+
+        summaries = []
+        try:
+            for cid, messages, path, data, summary in shards:
+                self._write_shard(cid, messages, path, data)
+                summaries.append(summary)
+        finally:
+            # Shards already written must reach the history list even if a later one failed
+            self._append_summaries(summaries)
+
+    def delete(self, cid: str) -> List[dict]:
+        # The shard shrinks to its base header, which keeps the version counter
+        removed = self.trim(cid, 0)
+        if removed:
+            self._append_summaries([{"cid": cid, "op": "delete"}])
+        return removed
+
+    def trim(self, cid: str, keep_last: int) -> List[dict]:
+        try:
+            path = self._path(cid)
+        except ValueError:
+            return []
+        with self._locked_shard(path, exclusive=True, create=False) as fd:
+            if fd is None or os.fstat(fd).st_size == 0:
+                return []
+            base, messages, _ = self._read(path, 0)
+            drop = len(messages) - max(0, keep_last)
+            if drop <= 0:
+                return []
+
+            tmp = path + ".trim"
+            with open(tmp, "wb") as f:
+                f.write(_dump_line({_BASE_KEY: base + drop}))
+                f.write(b"".join(_dump_line(m) for m in messages[drop:]))
+            os.replace(tmp, path)
+
+        with self._lock:
+            self._cache.pop(cid, None)
+        return messages[:drop]
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact_summaries()
+
+    def import_items(self, items: Iterable[Tuple[str, List[dict]]]) -> None:
+        """Write whole conversations as shards (used for migration)."""
+        summaries = []
+        for cid, msgs in items:
+            if not msgs:
+                continue
+            self._write_shard(cid, msgs)
+            summaries.append(_summary_record(cid, msgs[0], msgs[-1], len(msgs)))
+        self._append_summaries(summaries)
+        logger.info(f"Imported {len(summaries)} conversations into {self.directory}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    # ==========================================
+    # Internals
+    # ==========================================
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.directory, safe_filename(cid) + _SUFFIX)
+
+    def _load(self, cid: str) -> Tuple[int, List[dict]]:
+        """Return ``(base, messages)`` for a conversation, using the LRU when valid."""
+        try:
+            path = self._path(cid)
+            st = os.stat(path)
+        except (ValueError, FileNotFoundError):
+            return 0, []
+
+        with self._lock:
+            entry = self._cache.get(cid)
+            if entry and (entry.inode, entry.mtime_ns, entry.size) == (st.st_ino, st.st_mtime_ns, st.st_size):
+                self._cache.move_to_end(cid)
+                return entry.base, list(entry.messages)
+            cached = (entry.base, list(entry.messages), entry.size) if entry and entry.inode == st.st_ino else None
+
+        if cached and st.st_size > cached[2]:
+            # File only grew since we cached it: parse just the new tail
+            _, tail, size = self._read(path, cached[2])
+            base, messages = cached[0], cached[1] + tail
+        else:
+            base, messages, size = self._read(path, 0)
+
+        self._remember(cid, _CacheEntry(st.st_ino, st.st_mtime_ns, size, base, messages))
+        return base, list(messages)
+
+    @staticmethod
+    def _read(path: str, offset: int) -> Tuple[int, List[dict], int]:
+        """Parse complete lines from ``offset``; returns base, messages and the new offset."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        end = data.rfind(b"\n") + 1
+        base = 0
+        messages = []
+        for raw in data[:end].splitlines():
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+            except ValueError as e:
+                logger.warning(f"Skipping corrupt line in {path}: {e}")
+                continue
+            if _BASE_KEY in record:
+                base = record[_BASE_KEY]
+            else:
+                messages.append(record)
+        return base, messages, offset + end
+
+    @contextmanager
+    def _locked_shard(self, path: str, exclusive: bool, create: bool = True):
+        """
+        Open a shard for appending under a shared (append) or exclusive (rewrite) flock.
+
+        Re-opens when the file was replaced or removed while we waited, so
+        appends never land in an orphaned inode. With ``create=False`` a
+        missing shard yields None instead of being created.
+        """
+        flags = os.O_WRONLY | os.O_APPEND | (os.O_CREAT if create else 0)
+        while True:
+            try:
+                fd = os.open(path, flags, 0o644)
+            except FileNotFoundError:
+                yield None
+                return
+            if fcntl is None:
+                break
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        try:
+            yield fd
+        finally:
+            os.close(fd)  # releases the flock
+
+    def _write_shard(
+        self, cid: str, messages: List[dict], path: Optional[str] = None, data: Optional[bytes] = None
+    ) -> None:
+        path = path or self._path(cid)
+        if data is None:
+            data = b"".join(_dump_line(m) for m in messages)
+
+        with self._locked_shard(path, exclusive=False) as fd:
+            os.write(fd, data)  # single write: appends from other workers don't interleave
+            st = os.fstat(fd)
+
+        with self._lock:
+            entry = self._cache.get(cid)
+            if entry and entry.inode == st.st_ino and entry.size + len(data) == st.st_size:
+                # Nobody else wrote in between: extend the cached copy in place
+                entry.messages.extend(messages)
+                entry.size = st.st_size
+                entry.mtime_ns = st.st_mtime_ns
+                self._cache.move_to_end(cid)
+            elif entry:
+                del self._cache[cid]
+
+    def _append_summaries(self, records: List[dict]) -> None:
+        if not records:
+            return
+        with file_lock(self._summary_lock_path):
+            fd = os.open(self._summary_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, b"".join(_dump_line(r) for r in records))
+            finally:
+                os.close(fd)
+
+        with self._lock:
+            self._sync_summaries()
+            # Fold the log once it is mostly redundant per-append records
+            if self._summary_records > 4 * len(self._summaries) + 1000:
+                self._compact_summaries()
+
+    def _sync_summaries(self) -> None:
+        """Apply summary records written since the last sync (caller holds ``_lock``)."""
+        reset, lines = self._summary_tail.read_new()
+        if reset:
+            self._summaries.clear()
+            self._summary_records = 0
+        for raw in lines:
+            try:
+                rec = json.loads(raw)
+            except ValueError as e:
+                logger.warning(f"Skipping corrupt summary record: {e}")
+                continue
+            if rec.get("op") == "delete":
+                self._summaries.remove(rec["cid"], tombstone=True)
+                if "n" in rec:
+                    # Tombstone written by compaction
+                    self._summaries.add_tombstone(rec["cid"], rec.get("mode"), rec.get("preview", ""), rec["n"])
+            else:
+                self._summaries.add(rec["cid"], rec.get("mode"), rec.get("preview", ""), rec.get("ts"), rec.get("n", 1))
+            self._summary_records += 1
+
+    def _compact_summaries(self) -> None:
+        """Rewrite the summary log as one record per conversation (caller holds ``_lock``)."""
+        with file_lock(self._summary_lock_path):
+            self._sync_summaries()
+            tmp = self._summary_path + ".compact"
+            with open(tmp, "wb") as f:
+                for summary in self._summaries.page():
+                    f.write(_dump_line({
+                        "cid": summary["id"],
+                        "mode": summary["mode"],
+                        "preview": summary["preview"],
+                        "ts": summary["timestamp"],
+                        "n": summary["message_count"],
+                    }))
+                for tombstone in self._summaries.tombstones():
+                    f.write(_dump_line({
+                        "cid": tombstone["id"],
+                        "op": "delete",
+                        "mode": tombstone["mode"],
+                        "preview": tombstone["preview"],
+                        "n": tombstone["message_count"],
+                    }))
+            os.replace(tmp, self._summary_path)
+            self._summary_tail.mark_replaced()
+            self._summary_records = len(self._summaries)
+
+    def _rebuild_summaries(self) -> None:
+        """Build the summary log from the shards (first start on an older layout)."""
+        with open(self._summary_path + ".rebuild", "wb") as f:
+            for cid in self.conversation_ids():
+                base, msgs = self._load(cid)
+                if msgs:
+                    f.write(_dump_line(_summary_record(cid, msgs[0], msgs[-1], base + len(msgs))))
+        os.replace(self._summary_path + ".rebuild", self._summary_path)
+        logger.info(f"Rebuilt conversation summary index in {self.directory}")
+
+    def _remember(self, cid: str, entry: _CacheEntry) -> None:
+        if self.cache_size == 0:
+            return
+        with self._lock:
+            self._cache[cid] = entry
+            self._cache.move_to_end(cid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
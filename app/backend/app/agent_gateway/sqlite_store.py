@@ -0,0 +1,304 @@
+"""
+SQLite Conversation Store
+=========================
+
+Conversation backend on SQLite in WAL mode.
+
+- Readers never block the writer (WAL), so several uvicorn workers can
+  share one database file.
+- ``get`` is an indexed range scan on ``(conversation_id, idx)``.
+- ``append`` is a single-row insert plus a summary row update, serialised
+  across processes by ``BEGIN IMMEDIATE``.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.agent_gateway.conversation_store import ConversationStore, parse_cursor
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    mode TEXT,
+    preview TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated
+    ON conversations (updated_at DESC, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_mode_updated
+    ON conversations (mode, updated_at DESC, id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    mode TEXT,
+    timestamp TEXT,
+    extra TEXT,
+    PRIMARY KEY (conversation_id, idx)
+) WITHOUT ROWID;
+"""
+
+# Message keys stored in dedicated columns; anything else goes to ``extra``
+_COLUMNS = ("role", "content", "mode", "timestamp")
+
+
+def _row_to_message(row: sqlite3.Row) -> dict:
+    msg = {
+        "role": row["role"],
+        "content": row["content"],
+        "mode": row["mode"],
+        "timestamp": row["timestamp"],
+    }
+    if row["extra"]:
+        msg.update(json.loads(row["extra"]))
+    return msg
+
+
+class SqliteConversationStore(ConversationStore):
+    """
+    Conversation store backed by a WAL-mode SQLite database.
+
+    Args:
+        path: Database file path (e.g. ``data/conversations.db``)
+        busy_timeout_ms: How long a writer waits for another process' lock
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._conn_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+        logger.info(f"SQLite conversation store ready at {path}")
+
+    # ==========================================
+    # Reads
+    # ==========================================
+
+    def get(self, cid: str) -> List[dict]:
+        rows = self._conn().execute(
+            "SELECT role, content, mode, timestamp, extra FROM messages "
+            "WHERE conversation_id = ? ORDER BY idx",
+            (cid,),
+        )
+        return [_row_to_message(r) for r in rows]
+
+    def version(self, cid: str) -> int:
+        row = self._conn().execute(
+            "SELECT message_count FROM conversations WHERE id = ?", (cid,)
+        ).fetchone()
+        return row["message_count"] if row else 0
+
+    def get_since(self, cid: str, since: int = 0) -> Tuple[int, List[dict]]:
+        conn = self._conn()
+        # One read transaction so the version matches the rows returned
+        conn.execute("BEGIN")
+        try:
+            version = self.version(cid)
+            rows = conn.execute(
+                "SELECT role, content, mode, timestamp, extra FROM messages "
+                "WHERE conversation_id = ? AND idx >= ? ORDER BY idx",
+                (cid, max(0, since)),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return version, [_row_to_message(r) for r in rows]
+
+    def items(self) -> List[Tuple[str, List[dict]]]:
+        rows = self._conn().execute(
+            "SELECT conversation_id, role, content, mode, timestamp, extra FROM messages "
+            "ORDER BY conversation_id, idx"
+        )
+        out: dict = {}
+        for r in rows:
+            out.setdefault(r["conversation_id"], []).append(_row_to_message(r))
+        return list(out.items())
+
+    def iter_conversation_ids(self) -> Iterator[str]:
+        # Dedicated connection: a streaming consumer may resume us on any thread
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+        try:
+            cur = conn.execute("SELECT id FROM conversations ORDER BY id")
+            while True:
+                rows = cur.fetchmany(500)
+                if not rows:
+                    break
+                for (cid,) in rows:
+                    yield cid
+        finally:
+            conn.close()
+
+    def list_summaries(
+        self,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> List[dict]:
+        # Archived conversations keep their row but have no hot messages
+        sql = (
+            "SELECT id, mode, preview, updated_at, message_count FROM conversations c "
+            "WHERE EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.id)"
+        )
+        params: list = []
+        if mode:
+            sql += " AND mode = ?"
+            params.append(mode)
+        if before:
+            ts, cid = parse_cursor(before)
+            sql += " AND (updated_at < ? OR (updated_at = ? AND id < ?))"
+            params += [ts, ts, cid]
+        sql += " ORDER BY updated_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._conn().execute(sql, params)
+        return [
+            {
+                "id": r["id"],
+                "mode": r["mode"] or "security",
+                "preview": r["preview"] or "",
+                "timestamp": r["updated_at"],
+                "message_count": r["message_count"],
+            }
+            for r in rows
+        ]
+
+    def is_empty(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM conversations LIMIT 1").fetchone() is None
+
+    # ==========================================
+    # Writes
+    # ==========================================
+
+    def append(self, cid: str, message: dict) -> None:
+        self.append_many([(cid, message)])
+
+    def append_many(self, records: List[Tuple[str, dict]]) -> None:
+        """Insert a batch of messages in one transaction (one fsync per batch)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for cid, message in records:
+                self._insert(conn, cid, message)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, cid: str) -> List[dict]:
+        # The conversations row stays as a tombstone holding the version counter
+        return self.trim(cid, 0)
+
+    def trim(self, cid: str, keep_last: int) -> List[dict]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # message_count is the next idx, so cutoff is an absolute index
+            cutoff = self.version(cid) - max(0, keep_last)
+            rows = conn.execute(
+                "SELECT role, content, mode, timestamp, extra FROM messages "
+                "WHERE conversation_id = ? AND idx < ? ORDER BY idx",
+                (cid, cutoff),
+            ).fetchall()
+            conn.execute("DELETE FROM messages WHERE conversation_id = ? AND idx < ?", (cid, cutoff))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [_row_to_message(r) for r in rows]
+
+    def compact(self) -> None:
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def import_items(self, items: Iterable[Tuple[str, List[dict]]]) -> None:
+        """Bulk load conversations in a single transaction (used for migration)."""
+        records = []
+        count = 0
+        for cid, msgs in items:
+            records.extend((cid, msg) for msg in msgs)
+            count += 1
+        self.append_many(records)
+        logger.info(f"Imported {count} conversations into {self.path}")
+
+    def close(self) -> None:
+        with self._conn_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+    # ==========================================
+    # Internals
+    # ==========================================
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; autocommit mode, transactions are explicit."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._conn_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _insert(self, conn: sqlite3.Connection, cid: str, message: dict) -> None:
+        row = conn.execute(
+            "SELECT message_count FROM conversations WHERE id = ?", (cid,)
+        ).fetchone()
+        ts = message.get("timestamp")
+
+        if row is None:
+            idx = 0
+            conn.execute(
+                "INSERT INTO conversations (id, mode, preview, created_at, updated_at, message_count) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                (cid, message.get("mode", "security"), (message.get("content") or "")[:60], ts, ts),
+            )
+        else:
+            idx = row["message_count"]
+            conn.execute(
+                "UPDATE conversations SET updated_at = ?, message_count = ? WHERE id = ?",
+                (ts, idx + 1, cid),
+            )
+
+        extra = {k: v for k, v in message.items() if k not in _COLUMNS}
+        conn.execute(
+            "INSERT INTO messages (conversation_id, idx, role, content, mode, timestamp, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                cid,
+                idx,
+                message.get("role", ""),
+                message.get("content") or "",
+                message.get("mode"),
+                ts,
+                json.dumps(extra, ensure_ascii=False) if extra else None,
+            ),
+        )
@@ -1,18 +1,35 @@
+import json
 import uuid
-from fastapi import APIRouter, HTTPException
-from app.schemas.chat import ChatRequest, ChatResponse
-from app.agent_gateway.gateway import handle_chat, list_conversations, get_conversation
+from typing import Optional, Tuple
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.schemas.chat import ChatRequest, ChatResponse, Mode
+from app.agent_gateway.conversation_store import summary_cursor
+from app.core.config import IDEMPOTENCY_TTL_S, IDEMPOTENCY_MAX_KEYS
+from app.core.idempotency import IdempotencyCache, IdempotencyConflict, request_fingerprint
+from app.agent_gateway.gateway import (
+    handle_chat,
+    handle_chat_stream,
+    list_conversations,
+    get_conversation_delta,
+    get_conversation_version,
+    export_history,
+    import_history,
+)
 
 router = APIRouter()
 
-@router.post("/assistant/chat", response_model=ChatResponse)
-def assistant_chat(req: ChatRequest):
+# Retries carrying the same Idempotency-Key share one handle_chat run
+_IDEMPOTENCY = IdempotencyCache(ttl_s=IDEMPOTENCY_TTL_S, max_entries=IDEMPOTENCY_MAX_KEYS)
+
+async def _chat(req: ChatRequest) -> Tuple[ChatResponse, str]:
     cid = req.conversation_id or str(uuid.uuid4())
-    result = handle_chat(
+    result = await handle_chat(
         conversation_id=cid,
         mode=req.mode,
         message=req.message,
-        context=req.context
+        context=req.context,
+        fast=req.fast,
     )
     return ChatResponse(
         conversation_id=cid,
@@ -20,15 +37,99 @@ def assistant_chat(req: ChatRequest):
         intent=result["intent"],
         reply=result["reply"],
         tool_result=result.get("tool_result"),
+    ), result.get("server_timing", "")
+
+@router.post("/assistant/chat", response_model=ChatResponse)
+async def assistant_chat(
+    req: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+):
+    if not idempotency_key:
+        chat, server_timing = await _chat(req)
+        response.headers["Server-Timing"] = server_timing
+        return chat
+    try:
+        (chat, server_timing), replayed = await _IDEMPOTENCY.run(
+            idempotency_key,
+            request_fingerprint(req.model_dump()),
+            lambda: _chat(req),
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    else:
+        response.headers["Server-Timing"] = server_timing
+    return chat
+
+@router.post("/assistant/chat/stream")
+async def assistant_chat_stream(req: ChatRequest):
+    cid = req.conversation_id or str(uuid.uuid4())
+
+    async def events():
+        async for event, data in handle_chat_stream(
+            conversation_id=cid,
+            mode=req.mode,
+            message=req.message,
+            context=req.context,
+            fast=req.fast,
+        ):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: stop reverse proxies (nginx) from holding back tokens
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 @router.get("/assistant/history")
-def get_history():
-    return {"conversations": list_conversations()}
+def get_history(
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size; omit for the full list"),
+    before: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    mode: Optional[Mode] = None,
+):
+    convs = list_conversations(limit=limit, before=before, mode=mode)
+    next_cursor = summary_cursor(convs[-1]) if limit and len(convs) == limit else None
+    return {"conversations": convs, "next_cursor": next_cursor}
+
+# Declared before /assistant/history/{cid} so "export" is not taken as an id
+@router.get("/assistant/history/export")
+def export_chat_history():
+    return StreamingResponse(
+        export_history(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="sentri-history.ndjson"'},
+    )
+
+@router.post("/assistant/history/import")
+async def import_chat_history(request: Request):
+    # Body is consumed as it streams in; nothing holds the whole upload
+    return await import_history(request.stream())
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
 
 @router.get("/assistant/history/{cid}")
-def get_chat_history(cid: str):
-    msgs = get_conversation(cid)
-    if not msgs:
+def get_chat_history(
+    cid: str,
+    request: Request,
+    response: Response,
+    since: Optional[str] = Query(None, description="Message index (previous version) or ISO timestamp"),
+):
+    # Cheap version check first: unchanged conversations cost no message reads
+    version = get_conversation_version(cid)
+    if not version:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return {"messages": msgs}
+    etag = f'"v{version}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    version, msgs = get_conversation_delta(cid, since)
+    response.headers["ETag"] = f'"v{version}"'
+    response.headers["Cache-Control"] = "no-cache"
+    return {"messages": msgs, "version": version}
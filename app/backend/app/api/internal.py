@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from app.llm.llm_router import cache_stats, provider_health, telemetry
+from app.tools.media.scan_engine import ENGINE as scan_engine
+
+router = APIRouter(prefix="/internal")
+
+@router.get("/llm/cache")
+def llm_cache_stats():
+    return cache_stats()
+
+@router.get("/llm/health")
+def llm_provider_health():
+    return provider_health()
+
+@router.get("/llm/telemetry")
+def llm_telemetry():
+    return telemetry()
+
+@router.get("/scan/engine")
+def scan_engine_stats():
+    return scan_engine.stats()
@@ -1,18 +1,40 @@
-import os, uuid, json, time
+import os, uuid, json, time, asyncio, zipfile
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import APIRouter, UploadFile, File
-from starlette.concurrency import run_in_threadpool
-from app.tools.media.image_scan import scan_image
-from app.llm.llm_router import llm_explain
+from fastapi.responses import StreamingResponse
+from app.core.config import SCAN_BATCH_MAX_FILES, SCAN_BATCH_MAX_ZIP_BYTES, SCAN_BATCH_MAX_UNZIPPED_BYTES
+from app.tools.media.scan_engine import ENGINE, ScanTimeout
+from app.llm.llm_router import llm_explain_async
 
 router = APIRouter()
 
 MAX_BYTES = 8 * 1024 * 1024  # 8MB hackathon cap
 CHUNK_SIZE = 1024 * 1024     # 1MB chunks
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+async def _explain_image(tool_result: Dict[str, Any], fast: bool, batch_key: Optional[str] = None) -> str:
+    """LLM explanation of one scan result (never raises: falls back to a fixed note)."""
+    try:
+        # Async LLM path: awaits the pooled client instead of holding a threadpool thread
+        return await llm_explain_async(
+            user_message="Explain the heuristic image authenticity result clearly and give next steps.",
+            system_extra=(
+                "You are Sentri. Explain the heuristic image authenticity scan in simple terms. "
+                "Do not claim 100% certainty. Provide verification steps."
+            ),
+            context_json=json.dumps(tool_result, ensure_ascii=False),
+            fast=fast,
+            intent="image_scan",
+            batch_key=batch_key,
+        )
+    except Exception as e:
+        print(f"LLM Explanation failed: {e}")
+        return "Explanation unavailable. Showing forensic results only."
 
 @router.post("/scan/image")
-async def scan_image_api(file: UploadFile = File(...), use_llm: bool = False):
+async def scan_image_api(file: UploadFile = File(...), use_llm: bool = False, fast: bool = False):
     ext = os.path.splitext(file.filename or "")[1].lower()
-    if ext not in [".jpg", ".jpeg", ".png", ".webp"]:
+    if ext not in IMAGE_EXTS:
         return {"ok": False, "error": "Unsupported image type. Use jpg/png/webp."}
 
     os.makedirs("/tmp", exist_ok=True)
@@ -39,29 +61,18 @@ async def scan_image_api(file: UploadFile = File(...), use_llm: bool = False):
 
         t_upload = time.time()
 
-        # ✅ Run heavy CPU scan off the event loop
-        tool_result = await run_in_threadpool(scan_image, tmp)
+        # ✅ Run heavy CPU scan off the event loop (warm worker processes, per-scan timeout)
+        try:
+            tool_result = await ENGINE.scan(tmp)
+        except ScanTimeout as e:
+            return {"ok": False, "error": str(e)}
 
         t_scan = time.time()
 
         # ✅ LLM explanation should NEVER block returning tool_result
         explanation = None
         if use_llm:
-            try:
-                # run LLM in threadpool too (prevents blocking if llm_explain is slow)
-                # Note: llm_explain is synchronous, so we run it in threadpool
-                explanation = await run_in_threadpool(
-                    llm_explain,
-                    user_message="Explain the heuristic image authenticity result clearly and give next steps.",
-                    system_extra=(
-                        "You are Sentri. Explain the heuristic image authenticity scan in simple terms. "
-                        "Do not claim 100% certainty. Provide verification steps."
-                    ),
-                    context_json=json.dumps(tool_result, ensure_ascii=False),
-                )
-            except Exception as e:
-                print(f"LLM Explanation failed: {e}")
-                explanation = "Explanation unavailable. Showing forensic results only."
+            explanation = await _explain_image(tool_result, fast)
 
         t_llm = time.time()
 
@@ -87,3 +98,210 @@ async def scan_image_api(file: UploadFile = File(...), use_llm: bool = False):
                 os.remove(tmp)
         except:
             pass
+
+# ==========================================
+# Batch scan
+# ==========================================
+
+class _TooLarge(ValueError):
+    pass
+
+async def _save_upload(file: UploadFile, path: str, max_bytes: int) -> int:
+    """Stream an upload to ``path``; raises _TooLarge (and removes the file) past ``max_bytes``."""
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            f.write(chunk)
+    if size > max_bytes:
+        os.remove(path)
+        raise _TooLarge(f"File too large. Max {max_bytes//1024//1024}MB.")
+    return size
+
+def _unzip_images(zip_path: str, budget: int, max_files: int) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Extract the images of a ZIP to temp files: ``(name, path, error)`` per entry.
+
+    Zip-bomb guards: sizes are enforced on the bytes actually inflated (not
+    the declared ones), per image (``MAX_BYTES``) and in total (``budget``),
+    and at most ``max_files`` images are taken.
+    """
+    out = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            ext = os.path.splitext(base)[1].lower()
+            # Folders, macOS resource forks and hidden files are not images
+            if info.is_dir() or name.startswith("__MACOSX/") or base.startswith(".") or ext not in IMAGE_EXTS:
+                continue
+            if len(out) >= max_files:
+                out.append((name, None, f"Batch limit reached ({max_files} images)."))
+                break
+            if info.file_size > MAX_BYTES:
+                out.append((name, None, f"File too large. Max {MAX_BYTES//1024//1024}MB."))
+                continue
+            path = f"/tmp/{uuid.uuid4().hex}{ext}"
+            size = 0
+            error = None
+            try:
+                with zf.open(info) as src, open(path, "wb") as dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > MAX_BYTES:
+                            error = f"File too large. Max {MAX_BYTES//1024//1024}MB."
+                            break
+                        if size > budget:
+                            error = "ZIP expands past the batch size limit."
+                            break
+                        dst.write(chunk)
+            except (zipfile.BadZipFile, OSError, RuntimeError, NotImplementedError) as e:
+                # Corrupt, encrypted or unsupported entry
+                error = f"Unreadable ZIP entry: {e}"
+            if error:
+                os.remove(path)
+                out.append((name, None, error))
+                if size > budget:
+                    break
+                continue
+            budget -= size
+            out.append((name, path, None))
+    return out
+
+async def _scan_one(
+    index: int,
+    name: str,
+    path: Optional[str],
+    error: Optional[str],
+    use_llm: bool = False,
+    fast: bool = False,
+    batch_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    line: Dict[str, Any] = {"type": "result", "index": index, "filename": name}
+    if error:
+        return {**line, "ok": False, "error": error}
+    t0 = time.time()
+    try:
+        tool_result = await ENGINE.scan(path)
+    except Exception as e:
+        # One bad file never aborts the batch; report it under its own name, not the temp path
+        error = (str(e) or type(e).__name__).replace(path, name)
+        return {**line, "ok": False, "error": error, "timing_ms": {"scan": int((time.time() - t0) * 1000)}}
+    t_scan = time.time()
+    line = {**line, "ok": True, "tool_result": tool_result, "timing_ms": {"scan": int((t_scan - t0) * 1000)}}
+    if use_llm:
+        line["assistant_explanation"] = await _explain_image(tool_result, fast, batch_key)
+        line["timing_ms"]["llm"] = int((time.time() - t_scan) * 1000)
+    return line
+
+@router.post("/scan/images")
+async def scan_images_api(files: List[UploadFile] = File(...), use_llm: bool = False, fast: bool = False):
+    """
+    Scan many images (several files and/or ZIPs of images) in parallel.
+
+    Streams NDJSON: one ``result`` line per image in completion order
+    (``index`` is its position in the batch), then a ``summary`` line with
+    counts and aggregate timing. Per-image ``scan`` time includes waiting
+    for a free worker.
+
+    With ``use_llm`` each result also carries an explanation. The
+    explanations of one upload share a batch key, so with
+    ``LLM_BATCH_WINDOW_MS`` set, images finishing close together are
+    explained in one micro-batched prompt (never mixed with other uploads).
+    """
+    if len(files) > SCAN_BATCH_MAX_FILES:
+        return {"ok": False, "error": f"Too many files. Max {SCAN_BATCH_MAX_FILES} per batch."}
+
+    os.makedirs("/tmp", exist_ok=True)
+    t0 = time.time()
+    # (name, temp path, error): everything is on disk before streaming starts,
+    # since the uploads are closed once this handler returns
+    items: List[Tuple[str, Optional[str], Optional[str]]] = []
+    temp_paths: List[str] = []
+    try:
+        for file in files:
+            name = file.filename or f"file-{len(items)}"
+            ext = os.path.splitext(name)[1].lower()
+            if len(items) >= SCAN_BATCH_MAX_FILES:
+                items.append((name, None, f"Batch limit reached ({SCAN_BATCH_MAX_FILES} images)."))
+                break
+            if ext == ".zip":
+                zip_path = f"/tmp/{uuid.uuid4().hex}.zip"
+                try:
+                    await _save_upload(file, zip_path, SCAN_BATCH_MAX_ZIP_BYTES)
+                    try:
+                        entries = await asyncio.to_thread(
+                            _unzip_images, zip_path, SCAN_BATCH_MAX_UNZIPPED_BYTES, SCAN_BATCH_MAX_FILES - len(items)
+                        )
+                    finally:
+                        os.remove(zip_path)
+                except (_TooLarge, zipfile.BadZipFile) as e:
+                    items.append((name, None, str(e)))
+                    continue
+                if not entries:
+                    items.append((name, None, "ZIP contains no jpg/png/webp images."))
+                for entry, path, error in entries:
+                    items.append((f"{name}/{entry}", path, error))
+                    if path:
+                        temp_paths.append(path)
+            elif ext in IMAGE_EXTS:
+                path = f"/tmp/{uuid.uuid4().hex}{ext}"
+                try:
+                    await _save_upload(file, path, MAX_BYTES)
+                except _TooLarge as e:
+                    items.append((name, None, str(e)))
+                    continue
+                items.append((name, path, None))
+                temp_paths.append(path)
+            else:
+                items.append((name, None, "Unsupported image type. Use jpg/png/webp or a ZIP of them."))
+    except BaseException:
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    t_upload = time.time()
+    batch_key = f"scan-images:{uuid.uuid4().hex}"
+
+    async def results():
+        tasks = [asyncio.create_task(_scan_one(i, *item, use_llm, fast, batch_key)) for i, item in enumerate(items)]
+        ok = 0
+        try:
+            # The engine bounds concurrency to its workers (one per core by default)
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                ok += line["ok"]
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            t_end = time.time()
+            yield json.dumps({
+                "type": "summary",
+                "count": len(items),
+                "ok": ok,
+                "failed": len(items) - ok,
+                "timing_ms": {
+                    "upload": int((t_upload - t0) * 1000),
+                    "scan_wall": int((t_end - t_upload) * 1000),
+                    "total": int((t_end - t0) * 1000),
+                },
+                "images_per_s": round(len(items) / (t_end - t_upload), 2) if t_end > t_upload else None,
+                "workers": ENGINE.workers,
+            }) + "\n"
+        finally:
+            # Client gone or batch done: stop waiting and drop the temp files
+            for task in tasks:
+                task.cancel()
+            for path in temp_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
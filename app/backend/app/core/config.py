@@ -1,3 +1,4 @@
+# Core config
 import os
 from dotenv import load_dotenv
 
@@ -5,6 +6,73 @@ load_dotenv()
 
 SENTRI_MODE = os.getenv("SENTRI_MODE", "HACKATHON")
 
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # default provider name (see LLM_PROVIDERS)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-mini")
\ No newline at end of file
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")  # optional proxy / compatible endpoint for the openai provider
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-mini")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # concurrent upstream LLM calls per worker
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))  # pooled keep-alive HTTP connections
+LLM_KEEPALIVE_S = float(os.getenv("LLM_KEEPALIVE_S", "60"))
+# Extra OpenAI-compatible providers (JSON) and intent routing, e.g.
+# LLM_PROVIDERS={"local": {"base_url": "http://127.0.0.1:8080/v1", "model": "qwen2.5-1.5b-instruct"}}
+# LLM_INTENT_PROVIDERS=security_chat=local
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+LLM_INTENT_PROVIDERS = os.getenv("LLM_INTENT_PROVIDERS", "")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))  # in-memory explanations (0 disables)
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "3600"))
+LLM_CACHE_DISK_PATH = os.getenv("LLM_CACHE_DISK_PATH", "")  # SQLite file for a persistent tier ("" disables)
+LLM_TEMPLATE_VERDICTS = os.getenv("LLM_TEMPLATE_VERDICTS", "SAFE,LOW")  # explained by template, no LLM call
+LLM_BUDGET_MS = float(os.getenv("LLM_BUDGET_MS", "10000"))  # default per-call latency budget
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")  # second request once p95 is exceeded
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # consecutive failures that open the breaker
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+LLM_CONTEXT_BUDGETS = os.getenv(  # tool JSON token budget per intent
+    "LLM_CONTEXT_BUDGETS", "scan_link=300,scan_email=400,scan_logs=600,image_scan=300,default=500"
+)
+LLM_MAX_TOKENS = os.getenv(  # reply length cap per intent
+    "LLM_MAX_TOKENS", "scan_link=250,scan_email=300,image_scan=250,default=400"
+)
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))  # micro-batch wait, 0 = no batching (within one conversation / /scan/images upload)
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))  # explanations per batched prompt
+LLM_SIMILAR_INTENTS = os.getenv("LLM_SIMILAR_INTENTS", "security_chat")  # context-free intents reusing near-duplicate replies
+LLM_SIMILAR_SIZE = int(os.getenv("LLM_SIMILAR_SIZE", "2048"))  # 0 disables the near-duplicate cache
+LLM_SIMILAR_THRESHOLD = float(os.getenv("LLM_SIMILAR_THRESHOLD", "0.9"))  # min Jaccard similarity of normalized messages (same polarity words)
+LLM_PRICES = os.getenv("LLM_PRICES", "")  # JSON {"model": {"prompt": usd/1M, "completion": usd/1M}} over built-in prices
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")  # record | replay ("" = live calls only)
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "")  # default: <data>/llm_cassette.jsonl
+LLM_CASSETTE_LATENCY = os.getenv("LLM_CASSETTE_LATENCY", "off")  # replay wait: off | recorded | sample
+LLM_CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
+LLM_CASSETTE_SEED = int(os.getenv("LLM_CASSETTE_SEED", "0"))
+
+# Conversation persistence
+SENTRI_DATA_DIR = os.getenv("SENTRI_DATA_DIR", "")  # default: <repo>/data
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "jsonl")  # jsonl | sqlite | sharded
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "")  # default: <data>/conversations.db
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "256"))  # sharded: parsed conversations per worker
+CONVERSATION_COMPACT_INTERVAL_S = float(os.getenv("CONVERSATION_COMPACT_INTERVAL_S", "60"))
+CONVERSATION_COMPACT_MIN_APPENDS = int(os.getenv("CONVERSATION_COMPACT_MIN_APPENDS", "500"))
+PERSIST_QUEUE_SIZE = int(os.getenv("PERSIST_QUEUE_SIZE", "1000"))  # pending messages before chats wait
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "256"))  # max messages per group commit
+
+# Conversation retention: off unless a limit is set (0 disables it); cold data moves to
+# data/archive and drops out of the history sidebar, still readable via /assistant/history/{id}
+CONVERSATION_MAX_AGE_DAYS = float(os.getenv("CONVERSATION_MAX_AGE_DAYS", "0"))
+CONVERSATION_MAX_COUNT = int(os.getenv("CONVERSATION_MAX_COUNT", "0"))
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "0"))
+CONVERSATION_RETENTION_INTERVAL_S = float(os.getenv("CONVERSATION_RETENTION_INTERVAL_S", "3600"))
+
+# History export/import (NDJSON)
+HISTORY_IMPORT_BATCH_SIZE = int(os.getenv("HISTORY_IMPORT_BATCH_SIZE", "1000"))  # messages per import transaction
+HISTORY_IMPORT_MAX_LINE_BYTES = int(os.getenv("HISTORY_IMPORT_MAX_LINE_BYTES", "1048576"))
+
+# Image scanning (process | thread pool; 0 workers = one per available core)
+SCAN_EXECUTOR = os.getenv("SCAN_EXECUTOR", "process")
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "0"))
+SCAN_TIMEOUT_S = float(os.getenv("SCAN_TIMEOUT_S", "20"))  # per scan; a stuck process worker is killed
+SCAN_BATCH_MAX_FILES = int(os.getenv("SCAN_BATCH_MAX_FILES", "100"))  # images per POST /scan/images
+SCAN_BATCH_MAX_ZIP_BYTES = int(os.getenv("SCAN_BATCH_MAX_ZIP_BYTES", str(64 * 1024 * 1024)))
+SCAN_BATCH_MAX_UNZIPPED_BYTES = int(os.getenv("SCAN_BATCH_MAX_UNZIPPED_BYTES", str(256 * 1024 * 1024)))  # zip-bomb guard
+
+# Idempotency-Key handling for POST /assistant/chat
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "600"))  # how long a finished reply is replayed
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
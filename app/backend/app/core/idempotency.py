@@ -0,0 +1,112 @@
+"""
+Idempotency Keys
+================
+
+Collapses client retries of non-idempotent requests.
+
+The first request with a given key runs; duplicates arriving while it is
+in flight await the same task, and duplicates arriving later get the
+stored result until it expires. Reusing a key with a different request
+body is rejected. Failed computations are forgotten so a retry can run
+again.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+
+class IdempotencyConflict(ValueError):
+    """The key was already used for a different request."""
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-serialisable request body."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    task: asyncio.Task
+    expires_at: Optional[float] = None  # Set once completed
+    loop: asyncio.AbstractEventLoop = field(default_factory=asyncio.get_running_loop)
+
+
+class IdempotencyCache:
+    """
+    Bounded TTL cache of in-flight and completed results.
+
+    Args:
+        ttl_s: How long a completed result is replayed
+        max_entries: Max remembered keys (oldest evicted first)
+    """
+
+    def __init__(self, ttl_s: float = 600, max_entries: int = 10000):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """
+        Run ``compute`` once per key.
+
+        Returns:
+            ``(result, replayed)``; ``replayed`` is True for duplicates
+
+        Raises:
+            IdempotencyConflict: ``key`` was used with another fingerprint
+        """
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None and entry.loop is not asyncio.get_running_loop():
+            # Left over from another event loop (test clients / reloads)
+            del self._entries[key]
+            entry = None
+
+        replayed = entry is not None
+        if entry is None:
+            # A task, so a cancelled first request doesn't cancel the waiters
+            entry = _Entry(fingerprint, asyncio.ensure_future(compute()))
+            entry.task.add_done_callback(lambda t, k=key, e=entry: self._done(k, e, t))
+            self._entries[key] = entry
+            self._evict()
+        elif entry.fingerprint != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+
+        return await asyncio.shield(entry.task), replayed
+
+    def _done(self, key: str, entry: _Entry, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is not None:
+            # Only successes are replayed; a retry after a failure runs again
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            return
+        entry.expires_at = time.monotonic() + self.ttl_s
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        # Oldest first; a live head stops the sweep (max_entries still bounds the size)
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at is None or entry.expires_at > now:
+                break
+            del self._entries[key]
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            # In-flight waiters hold the task themselves, so dropping the entry is safe
+            self._entries.popitem(last=False)
@@ -0,0 +1,46 @@
+"""
+Stage timing
+============
+
+Lightweight per-request stage timer, reported as a ``Server-Timing``
+header so browser devtools and the load-test harness can see where a
+request spent its time.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """Accumulates wall-clock milliseconds per named stage."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+    def server_timing(self) -> str:
+        """Header value, e.g. ``intent;dur=0.05, llm;dur=812.4``."""
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.stages.items())
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Inverse of ``StageTimer.server_timing`` (unknown params are ignored)."""
+    out: Dict[str, float] = {}
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        for p in params:
+            key, _, value = p.partition("=")
+            if name and key == "dur":
+                try:
+                    out[name] = float(value)
+                except ValueError:
+                    pass
+    return out
@@ -0,0 +1,155 @@
+"""
+LLM Micro-Batching
+==================
+
+Groups explanation requests that arrive within a short window into one
+multi-item prompt, then splits the structured reply back per caller.
+
+- ``MicroBatcher``: generic async queue. Items submitted under the same
+  group key within ``window_ms`` are run together (at most ``max_size``
+  per batch; a full batch is flushed immediately).
+- ``build_batch_args`` / ``parse_batch_reply``: the multi-item prompt and
+  its JSON reply format (``{"items": [{"id": 0, "text": "..."}]}``).
+
+Items the model leaves out (or a reply that isn't valid JSON) come back
+as None so the caller can fall back to a single call.
+
+A batched prompt shows the model every item's request and context, so
+items of different users must never share one: the router only batches
+calls within one ``batch_key`` (a conversation, or one ``/scan/images`` upload).
+"""
+
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+BATCH_INSTRUCTIONS = (
+    "You will receive several independent ITEMS in the context JSON. Answer each one separately, "
+    "using only its own request and context. Reply with JSON only, no prose around it: "
+    '{"items": [{"id": <item id>, "text": "<answer>"}]}'
+)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def build_batch_args(items: List[dict]) -> dict:
+    """
+    One prompt for several ``agenerate_text`` argument dicts (same ``system_extra``).
+
+    Item ids are their positions; ``max_tokens`` is the sum of the items' caps.
+    """
+    batch = []
+    for i, args in enumerate(items):
+        try:
+            context = json.loads(args["context_json"]) if args["context_json"] else None
+        except ValueError:
+            context = args["context_json"]
+        batch.append({"id": i, "request": args["user_message"], "context": context})
+    caps = [args.get("max_tokens") for args in items]
+    return {
+        "user_message": BATCH_INSTRUCTIONS,
+        "system_extra": items[0]["system_extra"],
+        "context_json": json.dumps({"items": batch}, ensure_ascii=False, separators=(",", ":")),
+        "max_tokens": sum(caps) if all(caps) else None,
+    }
+
+
+def parse_batch_reply(reply: str, count: int) -> List[Optional[str]]:
+    """Per-item answers of a batch reply (None where an item is missing or empty)."""
+    out: List[Optional[str]] = [None] * count
+    try:
+        data = json.loads(_FENCE.sub("", reply.strip()))
+    except ValueError:
+        return out
+    entries = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return out
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        idx, text = entry.get("id"), entry.get("text")
+        if isinstance(idx, int) and 0 <= idx < count and isinstance(text, str) and text.strip():
+            out[idx] = text.strip()
+    return out
+
+
+class MicroBatcher:
+    """
+    Async micro-batching queue.
+
+    Args:
+        run_batch: ``async (group_key, items) -> results`` (one result per item)
+        window_ms: How long the first item of a batch waits for company (0 = disabled)
+        max_size: Items per batch; a full batch runs without waiting
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+        window_ms: float = 0,
+        max_size: int = 8,
+    ):
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_size = max(1, max_size)
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._counters = {"items": 0, "batches": 0, "batched_items": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0 and self.max_size > 1
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures and timers belong to one event loop (e.g. test clients / reloads)
+            self._loop = loop
+            self._pending.clear()
+            self._timers.clear()
+            self._tasks.clear()
+        return loop
+
+    async def submit(self, group: Hashable, item: Any) -> Any:
+        """Queue ``item`` and wait for its result (cancelling the wait leaves the batch running)."""
+        loop = self._bind_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(group, [])
+        queue.append((item, future))
+        self._counters["items"] += 1
+        if len(queue) >= self.max_size:
+            self._flush(group)
+        elif len(queue) == 1:
+            self._timers[group] = loop.call_later(self.window_ms / 1000, self._flush, group)
+        return await asyncio.shield(future)
+
+    def _flush(self, group: Hashable) -> None:
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        queue = self._pending.pop(group, None)
+        if queue:
+            task = self._loop.create_task(self._run(group, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group: Hashable, queue: List[Tuple[Any, asyncio.Future]]) -> None:
+        self._counters["batches"] += 1
+        if len(queue) > 1:
+            self._counters["batched_items"] += len(queue)
+        try:
+            results = await self.run_batch(group, [item for item, _ in queue])
+        except Exception as e:
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(queue, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"window_ms": self.window_ms, "max_size": self.max_size, **self._counters}
@@ -0,0 +1,189 @@
+"""
+LLM Response Cache
+==================
+
+Two-tier cache for LLM explanations.
+
+- Memory: bounded LRU with a TTL, shared by every request in the worker.
+- Disk (optional): SQLite table that survives restarts and is shared by
+  workers on the same machine. Memory misses fall through to it and hits
+  are promoted back into memory.
+
+Keys are hashes of everything that determines the reply (provider, model,
+prompt parts and a canonical form of the context JSON), see ``cache_key``.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Noise that doesn't change what the explanation should say: timings, and the
+# scanners' jittered scores (verdict, risk level and signals carry the meaning)
+_VOLATILE_KEYS = frozenset({"latency_ms", "timing_ms", "elapsed_ms", "risk_score", "confidence"})
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def canonical_context(context_json: str) -> str:
+    """Context JSON with sorted keys, no whitespace and volatile fields removed (cache keys only)."""
+    try:
+        data = json.loads(context_json) if context_json else {}
+    except ValueError:
+        return context_json  # Not JSON: use verbatim
+    return json.dumps(_strip_volatile(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def cache_key(
+    provider: str,
+    model: str,
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    max_tokens: Optional[int] = None,
+) -> str:
+    payload = json.dumps(
+        [provider, model, max_tokens, user_message, system_extra, canonical_context(context_json)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache with an optional SQLite second tier.
+
+    Args:
+        max_entries: In-memory entries (0 disables the memory tier)
+        ttl_s: Entry lifetime in both tiers
+        disk_path: SQLite file for the disk tier ("" disables it)
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 3600, disk_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.disk_path = disk_path
+
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "stores": 0}
+
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db().execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    @property
+    def has_disk(self) -> bool:
+        return bool(self.disk_path)
+
+    def get(self, key: str, disk: bool = True) -> Optional[str]:
+        """
+        Cached value or None.
+
+        ``disk=False`` only checks memory (never blocks on I/O) and doesn't
+        count a miss, so callers can try the disk tier off the event loop.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if disk and self.has_disk:
+            value = self._disk_get(key, now)
+            if value is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                self._remember(key, value, now)
+                return value
+
+        if disk or not self.has_disk:
+            with self._lock:
+                self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: str, disk: bool = True) -> None:
+        now = time.time()
+        self._remember(key, value, now)
+        with self._lock:
+            self._stats["stores"] += 1
+        if disk and self.has_disk:
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, now + self.ttl_s),
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"LLM disk cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats.update(max_entries=self.max_entries, ttl_s=self.ttl_s, disk=self.has_disk)
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.has_disk:
+            self._db().execute("DELETE FROM llm_cache")
+
+    def _remember(self, key: str, value: str, now: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (now + self.ttl_s, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        try:
+            row = self._db().execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db().execute("DELETE FROM llm_cache WHERE key = ? AND expires_at <= ?", (key, now))
+                return None
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache read failed: {e}")
+            return None
+
+    def _db(self) -> sqlite3.Connection:
+        """One autocommit connection per thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
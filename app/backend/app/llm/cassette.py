@@ -0,0 +1,273 @@
+"""
+LLM Cassettes
+=============
+
+Record / replay of upstream LLM calls, for offline and reproducible
+benchmarks.
+
+- ``record``: every upstream call still goes to the provider, and the
+  request (model, messages, sampling params), reply, usage and latency
+  are appended to a JSONL cassette.
+- ``replay``: no network at all. Calls are answered from the cassette by
+  request hash; identical requests recorded several times are served in
+  recorded order, cycling. A request that was never recorded raises
+  ``CassetteMiss``, which the router lets through (the request fails)
+  instead of falling back to a template, so misses can't hide in a run.
+
+Requests are hashed with their context JSON in the cache's canonical form
+(``canonical_context``): timings and jittered scanner scores differ from
+run to run and would otherwise make every replayed scan a miss.
+
+Replay latency (``LLM_CASSETTE_LATENCY``):
+
+- ``off``: answer immediately
+- ``recorded``: wait the latency recorded for that exact entry
+- ``sample``: wait a latency drawn (seeded) from all recorded calls, so
+  any prompt mix sees the recorded latency distribution
+
+``LLM_CASSETTE_LATENCY_SCALE`` multiplies the wait. Streams wait the
+recorded time to first token, then spread the rest over the chunks.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import (
+    LLM_CASSETTE_MODE,
+    LLM_CASSETTE_PATH,
+    LLM_CASSETTE_LATENCY,
+    LLM_CASSETTE_LATENCY_SCALE,
+    LLM_CASSETTE_SEED,
+    SENTRI_DATA_DIR,
+)
+from app.llm.cache import canonical_context
+from app.llm.prompts import CONTEXT_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Same default data dir as the conversation store (outside app/backend, so --reload ignores it)
+DEFAULT_PATH = os.path.join(
+    os.path.abspath(SENTRI_DATA_DIR or os.path.join(os.path.dirname(__file__), "../../../../data")),
+    "llm_cassette.jsonl",
+)
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recording for a request."""
+
+
+def _normalized(messages: List[dict]) -> List[dict]:
+    """Messages with the context JSON of the user message in canonical form."""
+    out = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str) and CONTEXT_HEADER in content:
+            request, _, context = content.partition(CONTEXT_HEADER)
+            message = {**message, "content": request + CONTEXT_HEADER + canonical_context(context)}
+        out.append(message)
+    return out
+
+
+def request_key(model: str, messages: List[dict], params: Dict[str, Any]) -> str:
+    """Hash of what determines a reply (the server URL, timeout and volatile context fields are left out)."""
+    sampling = {k: v for k, v in params.items() if k != "timeout"}
+    payload = json.dumps([model, sampling, _normalized(messages)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _usage_dict(usage: Any) -> Optional[Dict[str, int]]:
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt is None or completion is None:
+        return None
+    return {"prompt_tokens": prompt, "completion_tokens": completion}
+
+
+class _Usage:
+    """Attribute view of a recorded usage dict (same shape as the SDK's ``resp.usage``)."""
+
+    def __init__(self, usage: Optional[Dict[str, int]]):
+        self.prompt_tokens = (usage or {}).get("prompt_tokens")
+        self.completion_tokens = (usage or {}).get("completion_tokens")
+
+
+class Cassette:
+    """
+    One cassette file.
+
+    Args:
+        path: JSONL file (appended to in record mode, read at start in replay mode)
+        mode: ``record`` or ``replay``
+        latency: Replay wait: ``off`` | ``recorded`` | ``sample``
+        latency_scale: Multiplier for the replay wait
+        seed: Seed of the latency sampler
+    """
+
+    def __init__(self, path: str, mode: str, latency: str = "off", latency_scale: float = 1.0, seed: int = 0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._entries: Dict[str, List[dict]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        self._timings: List[Tuple[float, Optional[float]]] = []
+        self._counters = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            logger.warning(f"LLM cassette {self.path} not found; every replayed call will miss")
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    # Re-keyed on load, so cassettes recorded with an older key scheme still match
+                    key = request_key(entry["model"], entry["messages"], entry["params"]) if "messages" in entry else entry["key"]
+                    self._entries[key].append(entry)
+                    self._timings.append((float(entry["latency_ms"]), entry.get("ttft_ms")))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping cassette line {line_no}: {e}")
+        logger.info(f"Loaded {len(self._timings)} LLM calls from cassette {self.path}")
+
+    # ==========================================
+    # Record
+    # ==========================================
+
+    def record(
+        self,
+        model: str,
+        messages: List[dict],
+        params: Dict[str, Any],
+        reply: str,
+        usage: Any,
+        latency_ms: float,
+        ttft_ms: Optional[float] = None,
+    ) -> None:
+        entry = {
+            "key": request_key(model, messages, params),
+            "model": model,
+            "params": {k: v for k, v in params.items() if k != "timeout"},
+            "messages": messages,
+            "reply": reply,
+            "usage": _usage_dict(usage),
+            "latency_ms": round(latency_ms, 2),
+            "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._counters["recorded"] += 1
+
+    # ==========================================
+    # Replay
+    # ==========================================
+
+    def lookup(self, model: str, messages: List[dict], params: Dict[str, Any]) -> Tuple[str, _Usage, float, Optional[float]]:
+        """
+        Recorded ``(reply, usage, wait_ms, ttft_ms)`` for a request.
+
+        Raises:
+            CassetteMiss: the request was never recorded
+        """
+        key = request_key(model, messages, params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self._counters["misses"] += 1
+                logger.error(f"LLM cassette miss for request {key[:12]} (not recorded in {self.path})")
+                raise CassetteMiss(f"No cassette recording for request {key[:12]}")
+            entry = entries[self._cursor[key] % len(entries)]
+            self._cursor[key] += 1
+            self._counters["replayed"] += 1
+            if self.latency == "recorded":
+                wait_ms, ttft_ms = float(entry["latency_ms"]), entry.get("ttft_ms")
+            elif self.latency == "sample":
+                wait_ms, ttft_ms = self._rng.choice(self._timings)
+            else:
+                wait_ms, ttft_ms = 0.0, None
+        scale = self.latency_scale
+        return entry["reply"], _Usage(entry.get("usage")), wait_ms * scale, ttft_ms * scale if ttft_ms is not None else None
+
+    def replay(self, model: str, messages: List[dict], params: Dict[str, Any]) -> Tuple[str, _Usage]:
+        reply, usage, wait_ms, _ = self.lookup(model, messages, params)
+        if wait_ms > 0:
+            time.sleep(wait_ms / 1000)
+        return reply, usage
+
+    async def areplay(self, model: str, messages: List[dict], params: Dict[str, Any]) -> Tuple[str, _Usage]:
+        reply, usage, wait_ms, _ = self.lookup(model, messages, params)
+        if wait_ms > 0:
+            await asyncio.sleep(wait_ms / 1000)
+        return reply, usage
+
+    async def astream(self, model: str, messages: List[dict], params: Dict[str, Any]) -> AsyncIterator[str]:
+        """Replay as a stream of word chunks."""
+        reply, _, wait_ms, ttft_ms = self.lookup(model, messages, params)
+        words = reply.split(" ")
+        chunks = [c for c in [w + " " for w in words[:-1]] + [words[-1]] if c] or [""]
+        first_ms = ttft_ms if ttft_ms is not None else wait_ms
+        step_ms = max(0.0, wait_ms - first_ms) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            delay = first_ms if i == 0 else step_ms
+            if delay > 0:
+                await asyncio.sleep(delay / 1000)
+            yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "latency": self.latency,
+                "entries": sum(len(v) for v in self._entries.values()),
+                **self._counters,
+            }
+
+
+def open_cassette() -> Optional[Cassette]:
+    """Cassette from config (None unless ``LLM_CASSETTE_MODE`` is set)."""
+    if not LLM_CASSETTE_MODE:
+        return None
+    try:
+        return Cassette(
+            LLM_CASSETTE_PATH or DEFAULT_PATH,
+            LLM_CASSETTE_MODE,
+            latency=LLM_CASSETTE_LATENCY,
+            latency_scale=LLM_CASSETTE_LATENCY_SCALE,
+            seed=LLM_CASSETTE_SEED,
+        )
+    except ValueError as e:
+        logger.error(f"LLM cassette disabled: {e}")
+        return None
@@ -0,0 +1,170 @@
+"""
+LLM Context Compaction
+======================
+
+Shrinks tool JSON to a per-intent token budget before it goes into a
+prompt.
+
+Fields are ranked by how much they matter to an explanation:
+
+- ``DROP``: never useful to the model (disclaimers, timings, versions)
+- ``LOW``: raw scores, duplicated evidence, metadata notes
+- ``MEDIUM``: supporting detail (EXIF fields, actions, free text)
+- ``HIGH``: verdicts, levels, signals and reasons (always kept)
+
+Compaction removes ``DROP`` fields, then caps long strings/lists, then
+drops ``LOW`` and ``MEDIUM`` fields (largest first) until the context
+fits. Tokens are counted with ``tiktoken`` when installed, otherwise
+approximated at ~4 characters per token.
+"""
+
+import fnmatch
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # Not installed (or no cached encoding): use the approximation
+    _ENCODING = None
+
+DROP, LOW, MEDIUM, HIGH = 0, 1, 2, 3
+
+# First matching pattern wins; paths are dotted keys ("evidence.latency_ms")
+_PRIORITIES: List[Tuple[str, int]] = [
+    ("disclaimer", DROP),
+    ("*latency_ms", DROP),
+    ("*timing_ms", DROP),
+    ("*model_version", DROP),
+    ("heuristics.scores", LOW),
+    ("heuristics.scores.*", LOW),
+    ("evidence.top_signals", LOW),  # Same as signals
+    ("evidence.risk_score", LOW),  # Same as risk_score
+    ("exif.note", LOW),
+    ("assessment.ai_likelihood_score", LOW),
+    ("exif.fields", MEDIUM),
+    ("exif.fields.*", MEDIUM),
+    ("*recommended_actions", MEDIUM),
+    ("explanation", MEDIUM),
+    ("heuristics.type_guess", MEDIUM),
+    ("evidence.confidence", MEDIUM),
+    ("verdict", HIGH),
+    ("risk_level", HIGH),
+    ("risk_score", HIGH),
+    ("signals", HIGH),
+    ("exif.present", HIGH),
+    ("heuristics.indicators", HIGH),
+    ("assessment.ai_likelihood_level", HIGH),
+    ("assessment.reasons", HIGH),
+]
+
+MAX_STRING_CHARS = 300
+MAX_LIST_ITEMS = 8
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _priority(path: str) -> int:
+    for pattern, level in _PRIORITIES:
+        if fnmatch.fnmatchcase(path, pattern):
+            return level
+    return MEDIUM
+
+
+def _prune(value: Any, path: str = "") -> Any:
+    """Drop ``DROP`` fields and null/empty values, cap long strings and lists."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            child = f"{path}.{k}" if path else str(k)
+            if _priority(child) == DROP:
+                continue
+            v = _prune(v, child)
+            if v is None or v == {} or v == []:
+                continue
+            out[k] = v
+        return out
+    if isinstance(value, list):
+        items = [_prune(v, path) for v in value if v is not None]
+        return items[:MAX_LIST_ITEMS]
+    if isinstance(value, str) and len(value) > MAX_STRING_CHARS:
+        return value[:MAX_STRING_CHARS] + "…"
+    return value
+
+
+def _droppable(value: Any, path: str = "") -> List[Tuple[int, int, str]]:
+    """``(priority, -size, path)`` of every LOW/MEDIUM field, drop order first."""
+    out = []
+    if isinstance(value, dict):
+        for k, v in value.items():
+            child = f"{path}.{k}" if path else str(k)
+            level = _priority(child)
+            if level < HIGH:
+                out.append((level, -len(_dumps(v)), child))
+            out.extend(_droppable(v, child))
+    return sorted(out)
+
+
+def _delete(value: dict, path: str) -> None:
+    """Remove a dotted path, and any parent object it leaves empty."""
+    *parents, leaf = path.split(".")
+    chain = [value]
+    for key in parents:
+        value = value.get(key)
+        if not isinstance(value, dict):
+            return
+        chain.append(value)
+    value.pop(leaf, None)
+    for parent, key in zip(reversed(chain[:-1]), reversed(parents)):
+        if parent.get(key) != {}:
+            break
+        del parent[key]
+
+
+def compact_context(context_json: str, budget_tokens: Optional[int]) -> Tuple[str, int, int]:
+    """
+    Fit tool JSON into ``budget_tokens``.
+
+    Returns:
+        ``(compact_json, tokens_before, tokens_after)``; non-object JSON and
+        a falsy budget only get whitespace removed
+    """
+    before = count_tokens(context_json)
+    try:
+        data = json.loads(context_json) if context_json else {}
+    except ValueError:
+        return context_json, before, before
+    if not isinstance(data, dict) or not budget_tokens:
+        out = _dumps(data)
+        return out, before, count_tokens(out)
+
+    data = _prune(data)
+    out = _dumps(data)
+    for _, _, path in _droppable(data):
+        if count_tokens(out) <= budget_tokens:
+            break
+        _delete(data, path)
+        out = _dumps(data)
+    return out, before, count_tokens(out)
+
+
+def parse_intent_map(spec: str) -> Dict[str, int]:
+    """``"scan_link=300,default=500"`` -> ``{"scan_link": 300, "default": 500}``."""
+    out = {}
+    for part in spec.split(","):
+        intent, sep, value = part.partition("=")
+        if sep and intent.strip():
+            try:
+                out[intent.strip()] = int(value)
+            except ValueError:
+                pass
+    return out
@@ -0,0 +1,166 @@
+"""
+Provider Health
+===============
+
+Rolling latency / error tracking and a circuit breaker for the LLM
+provider.
+
+- Latency: EWMA plus a p95 over the last ``window`` successful calls
+  (used as the hedging delay).
+- Errors: EWMA of the failure rate.
+- Breaker: opens after ``failure_threshold`` consecutive failures, or when
+  the error EWMA passes ``error_rate_threshold``. While open, calls fail
+  instantly instead of waiting for the provider timeout. After
+  ``cooldown_s`` one probe call is let through (half-open): success
+  closes the breaker, failure re-opens it.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose breaker is open."""
+
+
+class ProviderHealth:
+    """
+    Health tracker and circuit breaker for one provider.
+
+    Args:
+        alpha: EWMA smoothing factor (higher reacts faster)
+        window: Latency samples kept for the p95
+        failure_threshold: Consecutive failures that open the breaker
+        error_rate_threshold: Error EWMA that opens the breaker
+        min_samples: Calls needed before the error EWMA / p95 are trusted
+        cooldown_s: How long the breaker stays open before a probe
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        window: int = 200,
+        failure_threshold: int = 5,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 20,
+        cooldown_s: float = 30.0,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self._latency_ewma: Optional[float] = None
+        self._error_ewma = 0.0
+        self._calls = 0
+        self._consecutive_failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    # ==========================================
+    # Breaker
+    # ==========================================
+
+    def acquire(self) -> None:
+        """
+        Permission to call the provider.
+
+        Raises:
+            CircuitOpenError: breaker open (or a half-open probe already running)
+        """
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._counters["rejected"] += 1
+        raise CircuitOpenError("LLM provider circuit breaker is open")
+
+    def release(self) -> None:
+        """End a call that was neither a success nor a failure (e.g. cancelled by the caller's budget)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._state == OPEN and time.monotonic() - self._opened_at < self.cooldown_s
+
+    # ==========================================
+    # Recording
+    # ==========================================
+
+    def record_success(self, latency_ms: float) -> None:
+        with self._lock:
+            self._calls += 1
+            self._counters["successes"] += 1
+            self._latencies.append(latency_ms)
+            self._latency_ewma = latency_ms if self._latency_ewma is None else (
+                self.alpha * latency_ms + (1 - self.alpha) * self._latency_ewma
+            )
+            self._error_ewma *= 1 - self.alpha
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            self._state = CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._calls += 1
+            self._counters["failures"] += 1
+            self._error_ewma = self.alpha + (1 - self.alpha) * self._error_ewma
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            too_many = self._consecutive_failures >= self.failure_threshold
+            error_rate = self._calls >= self.min_samples and self._error_ewma >= self.error_rate_threshold
+            if self._state == HALF_OPEN or too_many or error_rate:
+                if self._state != OPEN:
+                    self._counters["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    # ==========================================
+    # Estimates
+    # ==========================================
+
+    def p95_ms(self) -> Optional[float]:
+        """p95 latency of recent successes (None until ``min_samples`` calls)."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def latency_ewma_ms(self) -> Optional[float]:
+        with self._lock:
+            return self._latency_ewma
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95_ms()
+        with self._lock:
+            state = self._state
+            if state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+                state = HALF_OPEN
+            return {
+                "state": state,
+                "latency_ewma_ms": round(self._latency_ewma, 1) if self._latency_ewma is not None else None,
+                "latency_p95_ms": round(p95, 1) if p95 is not None else None,
+                "error_rate_ewma": round(self._error_ewma, 4),
+                "consecutive_failures": self._consecutive_failures,
+                **self._counters,
+            }
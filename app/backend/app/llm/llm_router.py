@@ -1,11 +1,499 @@
-from app.core.config import LLM_PROVIDER, OPENAI_API_KEY
-from app.llm.openai_client import generate_text
+# Sentri LLM layer
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Optional
+from app.core.config import (
+    LLM_CACHE_SIZE,
+    LLM_CACHE_TTL_S,
+    LLM_CACHE_DISK_PATH,
+    LLM_TEMPLATE_VERDICTS,
+    LLM_BUDGET_MS,
+    LLM_HEDGE,
+    LLM_CONTEXT_BUDGETS,
+    LLM_MAX_TOKENS,
+    LLM_BATCH_WINDOW_MS,
+    LLM_BATCH_MAX_SIZE,
+    LLM_SIMILAR_INTENTS,
+    LLM_SIMILAR_SIZE,
+    LLM_SIMILAR_THRESHOLD,
+)
+from app.llm.batching import MicroBatcher, build_batch_args, parse_batch_reply
+from app.llm.cache import ResponseCache, cache_key
+from app.llm.cassette import CassetteMiss
+from app.llm.context import compact_context, parse_intent_map
+from app.llm.openai_client import NOT_CONFIGURED
+from app.llm.providers import Provider, build_registry
+from app.llm.similarity import NearDuplicateCache
+from app.llm.telemetry import CallRecord, LLMTelemetry, collect_usage
+from app.llm.templates import is_routine, render_explanation
 
-def llm_explain(user_message: str, system_extra: str, context_json: str) -> str:
+LLM_UNAVAILABLE = "Sentri: (LLM temporarily unavailable) I can show the computed results and recommended next steps."
+LLM_DISABLED = "Sentri: (LLM disabled) I can show the computed results and recommended next steps."
+
+logger = logging.getLogger(__name__)
+
+# Identical explanations (same prompt + same tool JSON) are served from here
+_CACHE = ResponseCache(max_entries=LLM_CACHE_SIZE, ttl_s=LLM_CACHE_TTL_S, disk_path=LLM_CACHE_DISK_PATH)
+
+# Context-free questions asked in other words ("is this url safe" / "is this link safe?")
+_SIMILAR = NearDuplicateCache(max_entries=LLM_SIMILAR_SIZE, ttl_s=LLM_CACHE_TTL_S, threshold=LLM_SIMILAR_THRESHOLD)
+_SIMILAR_INTENTS = frozenset(i.strip() for i in LLM_SIMILAR_INTENTS.split(",") if i.strip())
+
+# Per-call latency / token / cost aggregates
+_TELEMETRY = LLMTelemetry()
+
+# Named providers (each with its own breaker) and intent -> provider routing
+_REGISTRY = build_registry()
+
+# Verdicts/levels that never need a rich LLM answer
+_ROUTINE = frozenset(v.strip().upper() for v in LLM_TEMPLATE_VERDICTS.split(",") if v.strip())
+
+# Per-intent prompt/reply token budgets ("default" covers the rest)
+_CONTEXT_BUDGETS = parse_intent_map(LLM_CONTEXT_BUDGETS)
+_MAX_TOKENS = parse_intent_map(LLM_MAX_TOKENS)
+
+def _for_intent(table: dict, intent: Optional[str]) -> Optional[int]:
+    return table.get(intent or "", table.get("default"))
+
+def _fit(context_json: str, intent: Optional[str]) -> str:
+    """Tool JSON compacted to the intent's token budget."""
+    compact, before, after = compact_context(context_json, _for_intent(_CONTEXT_BUDGETS, intent))
+    if after < before:
+        logger.info(f"LLM context for {intent or 'default'}: {before} -> {after} tokens")
+    return compact
+
+def _args(provider: Provider, user_message: str, system_extra: str, context_json: str, intent: Optional[str]) -> dict:
+    # Intent caps can only lower the provider's own reply limit
+    cap = provider.client.params["max_tokens"]
+    return {
+        "user_message": user_message,
+        "system_extra": system_extra,
+        "context_json": _fit(context_json, intent),
+        "max_tokens": min(_for_intent(_MAX_TOKENS, intent) or cap, cap),
+    }
+
+def _key(provider: Provider, args: dict) -> str:
+    return cache_key(
+        provider.name,
+        provider.model,
+        args["user_message"],
+        args["system_extra"],
+        args["context_json"],
+        args["max_tokens"],
+    )
+
+def _similar_namespace(provider: Provider, intent: Optional[str], args: dict) -> Optional[str]:
+    """Near-duplicate cache namespace, or None unless the prompt is context-free."""
+    if not _SIMILAR.enabled or intent not in _SIMILAR_INTENTS or args["context_json"] not in ("", "{}"):
+        return None
+    return f"{provider.name}|{provider.model}|{intent}|{args['max_tokens']}|{args['system_extra']}"
+
+def _cacheable(reply: str) -> bool:
+    # Never pin a fallback/empty reply for the whole TTL
+    return bool(reply) and reply not in (LLM_UNAVAILABLE, LLM_DISABLED, NOT_CONFIGURED)
+
+def _over_budget(provider: Provider, budget_ms: float) -> bool:
+    """The provider can't answer in time: breaker open, slots full or p95 above the budget."""
+    p95 = provider.health.p95_ms()
+    return provider.health.is_open or provider.client.saturated() or (p95 is not None and p95 > budget_ms)
+
+def _template(
+    context_json: str,
+    fast: bool,
+    provider: Optional[Provider] = None,
+    budget_ms: float = LLM_BUDGET_MS,
+    force: bool = False,
+) -> Optional[str]:
+    """
+    Template explanation if this call should skip the LLM.
+
+    Chosen when asked for (``fast``), for routine verdicts, when the LLM is
+    over budget, or with ``force`` (LLM disabled/failed). None means the
+    LLM is needed.
+    """
+    if not context_json:
+        return None
+    try:
+        result = json.loads(context_json)
+    except ValueError:
+        return None
+    if force or fast or is_routine(result, _ROUTINE) or (provider is not None and _over_budget(provider, budget_ms)):
+        return render_explanation(result)
+    return None
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the explanation cache and the near-duplicate cache."""
+    return {**_CACHE.stats(), "similar": _SIMILAR.stats()}
+
+def telemetry() -> dict:
+    """Latency histograms, token counts and cost per intent / model / cache status."""
+    return _TELEMETRY.snapshot()
+
+def provider_health() -> dict:
+    """Model, latency/error EWMAs and breaker state of every provider."""
+    return {
+        "default": _REGISTRY.default,
+        "routes": _REGISTRY.routes,
+        "providers": _REGISTRY.snapshot(),
+        "batching": _BATCHER.stats(),
+        "cassette": _REGISTRY.cassette.stats() if _REGISTRY.cassette else None,
+    }
+
+def select_provider(intent: Optional[str] = None, provider: Optional[str] = None) -> Optional[Provider]:
+    """Provider that would serve a call (None when no LLM is configured)."""
+    return _REGISTRY.select(intent, provider)
+
+async def aclose() -> None:
+    """Close every provider's pooled connections (app shutdown)."""
+    await _REGISTRY.aclose()
+
+async def _attempt(provider: Provider, args: dict, coalesce: bool = True) -> str:
+    """One tracked upstream call (raises CircuitOpenError while the breaker is open)."""
+    health = provider.health
+    health.acquire()
+    t0 = time.perf_counter()
+    try:
+        reply = await provider.client.agenerate_text(**args, coalesce=coalesce)
+    except (asyncio.CancelledError, CassetteMiss):
+        # Lost to a hedge or out of budget (the caller decides whether that counts),
+        # or not recorded in the replayed cassette (not the provider's fault)
+        health.release()
+        raise
+    except Exception:
+        health.record_failure()
+        raise
+    health.record_success((time.perf_counter() - t0) * 1000)
+    return reply
+
+async def _call_with_budget(provider: Provider, args: dict, budget_ms: float) -> str:
+    """
+    Upstream call bounded by ``budget_ms``, hedged once p95 has passed.
+
+    If the primary call is still running at the provider's p95 latency, a
+    second (uncoalesced) request is sent and whichever answers first wins.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget_ms / 1000
+    pending = {loop.create_task(_attempt(provider, args))}
+    error: Optional[BaseException] = None
+
+    p95 = provider.health.p95_ms()
+    if LLM_HEDGE and p95 is not None and p95 < budget_ms:
+        done, _ = await asyncio.wait(pending, timeout=p95 / 1000)
+        if not done and not provider.client.saturated():
+            pending.add(loop.create_task(_attempt(provider, args, coalesce=False)))
+
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        if error is not None and not pending:
+            raise error
+        # Out of budget: only blame the provider if the budget was fair (>= its usual p95)
+        if p95 is None or budget_ms >= p95:
+            provider.health.record_failure()
+        raise asyncio.TimeoutError(f"LLM call exceeded {budget_ms:.0f} ms budget")
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _run_batch(group: tuple, items: list) -> list:
+    """
+    Run queued ``(provider, args, budget_ms)`` items as one multi-item call.
+
+    Returns ``(reply, usage)`` per item; the batch's token usage is split evenly.
+    """
+    provider = items[0][0]
+    budget_ms = max(budget for _, _, budget in items)
+    with collect_usage() as usage:
+        if len(items) == 1:
+            replies = [await _call_with_budget(provider, items[0][1], budget_ms)]
+        else:
+            reply = await _call_with_budget(provider, build_batch_args([args for _, args, _ in items]), budget_ms)
+            replies = parse_batch_reply(reply, len(items))
+    share = (usage.prompt_tokens // len(items), usage.completion_tokens // len(items), usage.estimated)
+    return [(reply, share) for reply in replies]
+
+# Explanations arriving together (bulk scans) share one upstream prompt
+_BATCHER = MicroBatcher(_run_batch, window_ms=LLM_BATCH_WINDOW_MS, max_size=LLM_BATCH_MAX_SIZE)
+
+async def _call_batched(provider: Provider, args: dict, budget_ms: float, call: CallRecord, batch_key: str) -> str:
+    """
+    Upstream call through the micro-batch queue, within ``budget_ms`` overall.
+
+    Only items with the same ``batch_key`` share a prompt: one prompt never
+    mixes two users' messages or scanned content, which could steer or leak
+    into each other's answers.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget_ms / 1000
+    group = (provider.name, args["system_extra"], batch_key)
+    reply, usage = await asyncio.wait_for(_BATCHER.submit(group, (provider, args, budget_ms)), timeout=budget_ms / 1000)
+    call.add_usage(*usage)
+    call.cache = "batched"
+    if reply is None:
+        # Left out of the batch reply: ask on its own with what is left of the budget
+        remaining_ms = (deadline - loop.time()) * 1000
+        if remaining_ms <= 0:
+            raise asyncio.TimeoutError(f"LLM call exceeded {budget_ms:.0f} ms budget")
+        reply = await _call_with_budget(provider, args, remaining_ms)
+    return reply
+
+def llm_explain(
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    fast: bool = False,
+    intent: Optional[str] = None,
+    provider: Optional[str] = None,
+) -> str:
     """Route to LLM provider with hackathon-safe fallback."""
-    if LLM_PROVIDER == "openai" and OPENAI_API_KEY:
+    with _TELEMETRY.track(intent) as call:
+        return _explain(call, user_message, system_extra, context_json, fast, intent, provider)
+
+def _explain(
+    call: CallRecord,
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    fast: bool,
+    intent: Optional[str],
+    provider: Optional[str],
+) -> str:
+    p = _REGISTRY.select(intent, provider)
+    if p is None:
+        call.cache = "disabled"
+        return _template(context_json, fast, force=True) or LLM_DISABLED
+    call.provider, call.model = p.name, p.model
+    reply = _template(context_json, fast, p)
+    if reply is not None:
+        call.cache = "template"
+        return reply
+
+    args = _args(p, user_message, system_extra, context_json, intent)
+    key = _key(p, args)
+    cached = _CACHE.get(key)
+    if cached is not None:
+        call.cache = "hit"
+        return cached
+    similar = _similar_namespace(p, intent, args)
+    cached = _SIMILAR.get(similar, user_message) if similar else None
+    if cached is not None:
+        call.cache = "similar"
+        return cached
+    try:
+        p.health.acquire()
+        t0 = time.perf_counter()
         try:
-            return generate_text(user_message, system_extra=system_extra, context_json=context_json)
+            reply = p.client.generate_text(**args)
+        except CassetteMiss:
+            p.health.release()
+            raise
         except Exception:
-            return "Sentri: (LLM temporarily unavailable) I can show the computed results and recommended next steps."
-    return "Sentri: (LLM disabled) I can show the computed results and recommended next steps."
+            p.health.record_failure()
+            raise
+        p.health.record_success((time.perf_counter() - t0) * 1000)
+    except CassetteMiss:
+        # A replayed run must not quietly measure the fallback path
+        raise
+    except Exception:
+        call.cache = "fallback"
+        return _template(context_json, fast, force=True) or LLM_UNAVAILABLE
+    if _cacheable(reply):
+        _CACHE.put(key, reply)
+        if similar:
+            _SIMILAR.put(similar, user_message, reply)
+    return reply
+
+async def llm_explain_async(
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    fast: bool = False,
+    budget_ms: Optional[float] = None,
+    intent: Optional[str] = None,
+    provider: Optional[str] = None,
+    batch_key: Optional[str] = None,
+) -> str:
+    """
+    Async llm_explain for the event loop: same routing, cache and fallback, no blocked thread.
+
+    ``budget_ms`` caps how long this call site waits for the LLM (default
+    ``LLM_BUDGET_MS``); past it, or while the breaker is open, the template
+    or fallback reply is returned instead. ``intent`` picks the provider via
+    ``LLM_INTENT_PROVIDERS`` unless ``provider`` names one explicitly. With
+    ``LLM_BATCH_WINDOW_MS`` set, concurrent calls with the same ``batch_key``
+    (one conversation, one ``/scan/images`` upload) are micro-batched; calls
+    without one never are.
+    """
+    with _TELEMETRY.track(intent) as call:
+        return await _explain_async(call, user_message, system_extra, context_json, fast, budget_ms, intent, provider, batch_key)
+
+async def _explain_async(
+    call: CallRecord,
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    fast: bool,
+    budget_ms: Optional[float],
+    intent: Optional[str],
+    provider: Optional[str],
+    batch_key: Optional[str],
+) -> str:
+    budget_ms = budget_ms or LLM_BUDGET_MS
+    p = _REGISTRY.select(intent, provider)
+    if p is None:
+        call.cache = "disabled"
+        return _template(context_json, fast, force=True) or LLM_DISABLED
+    call.provider, call.model = p.name, p.model
+    reply = _template(context_json, fast, p, budget_ms)
+    if reply is not None:
+        call.cache = "template"
+        return reply
+
+    args = _args(p, user_message, system_extra, context_json, intent)
+    key = _key(p, args)
+    # Memory tier inline; the disk tier (SQLite) is only touched off the event loop
+    cached = _CACHE.get(key, disk=False)
+    if cached is None and _CACHE.has_disk:
+        cached = await asyncio.to_thread(_CACHE.get, key)
+    call.cache = "hit"
+    similar = _similar_namespace(p, intent, args)
+    if cached is None and similar:
+        cached = _SIMILAR.get(similar, user_message)
+        call.cache = "similar"
+    if cached is not None:
+        return cached
+    call.cache = "miss"
+    try:
+        if _BATCHER.enabled and batch_key:
+            reply = await _call_batched(p, args, budget_ms, call, batch_key)
+        else:
+            reply = await _call_with_budget(p, args, budget_ms)
+    except CassetteMiss:
+        # A replayed run must not quietly measure the fallback path
+        raise
+    except Exception:
+        call.cache = "fallback"
+        return _template(context_json, fast, force=True) or LLM_UNAVAILABLE
+    if _cacheable(reply):
+        if _CACHE.has_disk:
+            await asyncio.to_thread(_CACHE.put, key, reply)
+        else:
+            _CACHE.put(key, reply)
+        if similar:
+            _SIMILAR.put(similar, user_message, reply)
+    return reply
+
+async def llm_explain_stream(
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    fast: bool = False,
+    budget_ms: Optional[float] = None,
+    intent: Optional[str] = None,
+    provider: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Streaming llm_explain_async: yields reply deltas (a cache hit, template or fallback is one delta).
+
+    ``budget_ms`` bounds the wait for the first token; streams are not hedged.
+    Telemetry latency covers the whole stream.
+    """
+    with _TELEMETRY.track(intent) as call:
+        async for delta in _explain_stream(call, user_message, system_extra, context_json, fast, budget_ms, intent, provider):
+            yield delta
+
+async def _explain_stream(
+    call: CallRecord,
+    user_message: str,
+    system_extra: str,
+    context_json: str,
+    fast: bool,
+    budget_ms: Optional[float],
+    intent: Optional[str],
+    provider: Optional[str],
+) -> AsyncIterator[str]:
+    budget_ms = budget_ms or LLM_BUDGET_MS
+    p = _REGISTRY.select(intent, provider)
+    if p is None:
+        call.cache = "disabled"
+        yield _template(context_json, fast, force=True) or LLM_DISABLED
+        return
+    call.provider, call.model = p.name, p.model
+    reply = _template(context_json, fast, p, budget_ms)
+    if reply is not None:
+        call.cache = "template"
+        yield reply
+        return
+
+    args = _args(p, user_message, system_extra, context_json, intent)
+    key = _key(p, args)
+    cached = _CACHE.get(key, disk=False)
+    if cached is None and _CACHE.has_disk:
+        cached = await asyncio.to_thread(_CACHE.get, key)
+    call.cache = "hit"
+    similar = _similar_namespace(p, intent, args)
+    if cached is None and similar:
+        cached = _SIMILAR.get(similar, user_message)
+        call.cache = "similar"
+    if cached is not None:
+        yield cached
+        return
+    call.cache = "miss"
+
+    parts = []
+    stream = None
+    try:
+        p.health.acquire()
+        t0 = time.perf_counter()
+        stream = p.client.astream_text(**args)
+        first = await asyncio.wait_for(stream.__anext__(), timeout=budget_ms / 1000)
+        parts.append(first)
+        yield first
+        async for delta in stream:
+            parts.append(delta)
+            yield delta
+    except StopAsyncIteration:
+        pass  # ended before the first delta: an empty reply, handled below
+    except (GeneratorExit, asyncio.CancelledError, CassetteMiss):
+        # Client went away mid-stream, or a replayed run hit an unrecorded request
+        p.health.release()
+        raise
+    except Exception:
+        if stream is not None:
+            p.health.record_failure()
+        # Mid-stream failures keep what was already sent; only an empty reply gets the fallback
+        if not parts:
+            call.cache = "fallback"
+            yield _template(context_json, fast, force=True) or LLM_UNAVAILABLE
+        return
+    finally:
+        if stream is not None:
+            await stream.aclose()
+
+    reply = "".join(parts)
+    if not reply.strip():
+        # A stream without any text is a failed call, not an answer to persist
+        p.health.record_failure()
+        call.cache = "fallback"
+        yield _template(context_json, fast, force=True) or LLM_UNAVAILABLE
+        return
+    p.health.record_success((time.perf_counter() - t0) * 1000)
+    if _cacheable(reply):
+        if _CACHE.has_disk:
+            await asyncio.to_thread(_CACHE.put, key, reply)
+        else:
+            _CACHE.put(key, reply)
+        if similar:
+            _SIMILAR.put(similar, user_message, reply)
@@ -1,24 +1,237 @@
-from openai import OpenAI
-from app.core.config import OPENAI_API_KEY, LLM_MODEL
-from app.llm.prompts import SYSTEM_SENTRI
+import asyncio
+import hashlib
+import json
+import time
+from typing import AsyncIterator, Dict, Optional
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+import httpx
+from app.core.config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_CONNECTIONS,
+    LLM_KEEPALIVE_S,
+)
+from app.llm.cassette import Cassette
+from app.llm.prompts import CONTEXT_HEADER, SYSTEM_SENTRI
+from app.llm.telemetry import note_usage
 
-_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+NOT_CONFIGURED = "Sentri: (OpenAI client not configured) Showing computed results."
 
-def generate_text(user_message: str, system_extra: str = "", context_json: str = "") -> str:
-    if not _client:
-        return "Sentri: (OpenAI client not configured) Showing computed results."
-    
-    messages = [
+def build_messages(user_message: str, system_extra: str, context_json: str) -> list[dict]:
+    return [
         {"role": "system", "content": SYSTEM_SENTRI + "\n" + system_extra},
-        {"role": "user", "content": f"{user_message}\n\nCONTEXT JSON:\n{context_json}".strip()}
+        {"role": "user", "content": f"{user_message}{CONTEXT_HEADER}{context_json}".strip()}
     ]
-    
-    # Optimized call with timeout and token limit
-    resp = _client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=messages,
-        temperature=0.3,
-        max_tokens=400,  # Cap length for speed
-        timeout=10.0     # Fail fast (10s)
-    )
-    return resp.choices[0].message.content or ""
+
+class OpenAICompatibleClient:
+    """
+    Chat-completions client for OpenAI or any OpenAI-compatible server.
+
+    Args:
+        api_key: API key (local servers usually accept any non-empty value)
+        model: Model name sent with every call
+        base_url: Server root such as ``http://127.0.0.1:8080/v1`` (None = api.openai.com)
+        timeout_s: Per-call upstream timeout
+        max_tokens: Reply length cap
+        max_concurrency: Concurrent upstream calls (per event loop)
+        max_connections: Pooled keep-alive HTTP connections
+        keepalive_s: Idle time before a pooled connection is closed
+        cassette: Record upstream calls to it, or replay them from it (no network)
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: Optional[str] = None,
+        timeout_s: float = 10.0,
+        max_tokens: int = 400,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        keepalive_s: float = LLM_KEEPALIVE_S,
+        cassette: Optional[Cassette] = None,
+    ):
+        self.model = model
+        self.base_url = base_url
+        self.cassette = cassette
+        self.max_concurrency = max_concurrency
+        # Shared call parameters: capped length for speed, fail fast
+        self.params = {"temperature": 0.3, "max_tokens": max_tokens, "timeout": timeout_s}
+
+        # max_retries=0: the router's breaker/hedging/fallbacks retry; hidden SDK backoff would skew them
+        self._client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0) if api_key else None
+        # One pooled HTTP client for every async call: keep-alive connections are reused across requests
+        self._async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                    keepalive_expiry=keepalive_s,
+                ),
+            ),
+        ) if api_key else None
+
+        # Upstream concurrency cap and in-flight prompt coalescing (per event loop)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def configured(self) -> bool:
+        return self._async_client is not None or self._replaying
+
+    @property
+    def _replaying(self) -> bool:
+        return self.cassette is not None and self.cassette.replaying
+
+    @property
+    def _recording(self) -> bool:
+        return self.cassette is not None and self.cassette.recording
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. test clients / reloads)
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight.clear()
+        return loop
+
+    def _params(self, max_tokens: Optional[int]) -> dict:
+        # Per-call reply cap (per-intent limits, multi-item batches)
+        if max_tokens:
+            return {**self.params, "max_tokens": max_tokens}
+        return self.params
+
+    def _prompt_key(self, messages: list[dict], params: dict) -> str:
+        payload = json.dumps([self.base_url, self.model, params, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _complete(self, messages: list[dict], params: dict) -> str:
+        """Blocking upstream call."""
+        if self._replaying:
+            text, usage = self.cassette.replay(self.model, messages, params)
+            note_usage(usage, messages, text)
+            return text
+        if not self._client:
+            return NOT_CONFIGURED
+        t0 = time.perf_counter()
+        resp = self._client.chat.completions.create(model=self.model, messages=messages, **params)
+        text = resp.choices[0].message.content or ""
+        note_usage(resp.usage, messages, text)
+        if self._recording:
+            self.cassette.record(self.model, messages, params, text, resp.usage, (time.perf_counter() - t0) * 1000)
+        return text
+
+    async def _acomplete(self, messages: list[dict], params: dict) -> str:
+        """Non-blocking upstream call over the pooled client."""
+        if self._replaying:
+            text, usage = await self.cassette.areplay(self.model, messages, params)
+            note_usage(usage, messages, text)
+            return text
+        if not self._async_client:
+            return NOT_CONFIGURED
+        t0 = time.perf_counter()
+        resp = await self._async_client.chat.completions.create(model=self.model, messages=messages, **params)
+        text = resp.choices[0].message.content or ""
+        note_usage(resp.usage, messages, text)
+        if self._recording:
+            latency_ms = (time.perf_counter() - t0) * 1000
+            await asyncio.to_thread(self.cassette.record, self.model, messages, params, text, resp.usage, latency_ms)
+        return text
+
+    async def _astream(self, messages: list[dict], params: dict) -> AsyncIterator[str]:
+        """Upstream call in streaming mode: yields content deltas as they arrive."""
+        if self._replaying:
+            parts = []
+            async for delta in self.cassette.astream(self.model, messages, params):
+                parts.append(delta)
+                yield delta
+            note_usage(None, messages, "".join(parts))
+            return
+        if not self._async_client:
+            yield NOT_CONFIGURED
+            return
+        t0 = time.perf_counter()
+        ttft_ms = None
+        stream = await self._async_client.chat.completions.create(
+            # include_usage: a last, choice-less chunk reports the real token usage
+            model=self.model, messages=messages, stream=True, stream_options={"include_usage": True}, **params
+        )
+        parts = []
+        usage = None
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - t0) * 1000
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        text = "".join(parts)
+        note_usage(usage, messages, text)
+        if self._recording:
+            latency_ms = (time.perf_counter() - t0) * 1000
+            await asyncio.to_thread(self.cassette.record, self.model, messages, params, text, usage, latency_ms, ttft_ms)
+
+    def generate_text(self, user_message: str, system_extra: str = "", context_json: str = "", max_tokens: Optional[int] = None) -> str:
+        return self._complete(build_messages(user_message, system_extra, context_json), self._params(max_tokens))
+
+    async def agenerate_text(
+        self,
+        user_message: str,
+        system_extra: str = "",
+        context_json: str = "",
+        coalesce: bool = True,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Async variant of generate_text: awaits the upstream call instead of holding a thread.
+
+        At most ``max_concurrency`` calls run upstream at once, and
+        identical prompts already in flight share one upstream call
+        (``coalesce=False`` forces a separate call, e.g. for a hedge).
+        """
+        loop = self._bind_loop()
+        messages = build_messages(user_message, system_extra, context_json)
+        params = self._params(max_tokens)
+        if not coalesce:
+            return await self._limited(messages, params)
+        key = self._prompt_key(messages, params)
+        task = self._inflight.get(key)
+        if task is None:
+            task = loop.create_task(self._limited(messages, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        # Shielded: one caller giving up must not cancel the call the others wait on
+        return await asyncio.shield(task)
+
+    async def _limited(self, messages: list[dict], params: dict) -> str:
+        async with self._semaphore:
+            return await self._acomplete(messages, params)
+
+    async def astream_text(
+        self,
+        user_message: str,
+        system_extra: str = "",
+        context_json: str = "",
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """Streaming variant of agenerate_text (counts against the same concurrency cap, never coalesced)."""
+        self._bind_loop()
+        async with self._semaphore:
+            messages = build_messages(user_message, system_extra, context_json)
+            async for delta in self._astream(messages, self._params(max_tokens)):
+                yield delta
+
+    def saturated(self) -> bool:
+        """True while every upstream slot is busy (a new call would have to queue)."""
+        return self._semaphore is not None and self._semaphore.locked()
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections (app shutdown)."""
+        if self._async_client:
+            await self._async_client.close()
+        if self._client:
+            self._client.close()
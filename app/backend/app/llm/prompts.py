@@ -1,3 +1,6 @@
+# Separates the request from the tool JSON in the user message
+CONTEXT_HEADER = "\n\nCONTEXT JSON:\n"
+
 SYSTEM_SENTRI = """You are Sentri, an AI assistant.
 You must be accurate and avoid repeating yourself.
 For automotive: explain TCO results and tradeoffs using only the provided tool JSON.
@@ -0,0 +1,155 @@
+"""
+LLM Provider Registry
+=====================
+
+Named OpenAI-compatible providers and per-intent routing.
+
+- ``openai``: built in, uses ``OPENAI_API_KEY`` / ``LLM_MODEL`` (and
+  ``OPENAI_BASE_URL`` when set, e.g. for a proxy).
+- Extra providers come from ``LLM_PROVIDERS``, a JSON object such as::
+
+      {"local": {"base_url": "http://127.0.0.1:8080/v1", "model": "qwen2.5-1.5b-instruct"}}
+
+  Any server speaking the chat-completions API works (llama.cpp, vLLM,
+  Ollama, a test stand-in...).
+- ``LLM_INTENT_PROVIDERS`` maps intents to providers, e.g.
+  ``security_chat=local``; other intents use ``LLM_PROVIDER``.
+
+Each provider has its own client, connection pool, concurrency cap and
+health tracker / circuit breaker. All of them share the cassette set by
+``LLM_CASSETTE_MODE`` (record / replay, see ``app.llm.cassette``).
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from app.core.config import (
+    LLM_PROVIDER,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    LLM_MODEL,
+    LLM_PROVIDERS,
+    LLM_INTENT_PROVIDERS,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_COOLDOWN_S,
+    LLM_MAX_CONCURRENCY,
+)
+from app.llm.cassette import Cassette, open_cassette
+from app.llm.health import ProviderHealth
+from app.llm.openai_client import OpenAICompatibleClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Provider:
+    """A named LLM backend with its own client and health tracker."""
+    name: str
+    client: OpenAICompatibleClient
+    health: ProviderHealth = field(
+        default_factory=lambda: ProviderHealth(failure_threshold=LLM_BREAKER_FAILURES, cooldown_s=LLM_BREAKER_COOLDOWN_S)
+    )
+
+    @property
+    def model(self) -> str:
+        return self.client.model
+
+    @property
+    def enabled(self) -> bool:
+        return self.client.configured
+
+
+class ProviderRegistry:
+    """
+    Providers by name plus the intent -> provider routing table.
+
+    Args:
+        default: Provider used for intents without a route
+        routes: ``{intent: provider name}``
+        cassette: Record/replay cassette shared by the providers
+    """
+
+    def __init__(self, default: str, routes: Optional[Dict[str, str]] = None, cassette: Optional[Cassette] = None):
+        self.default = default
+        self.routes = dict(routes or {})
+        self.cassette = cassette
+        self._providers: Dict[str, Provider] = {}
+
+    def register(self, provider: Provider) -> None:
+        self._providers[provider.name] = provider
+
+    def get(self, name: str) -> Optional[Provider]:
+        return self._providers.get(name)
+
+    def names(self) -> list:
+        return list(self._providers)
+
+    def select(self, intent: Optional[str] = None, name: Optional[str] = None) -> Optional[Provider]:
+        """
+        Provider for one call: explicit ``name``, else the intent's route, else the default.
+
+        Returns None when nothing usable is configured (LLM disabled).
+        """
+        for candidate in (name, self.routes.get(intent or ""), self.default):
+            provider = self._providers.get(candidate) if candidate else None
+            if provider is not None and provider.enabled:
+                return provider
+        return None
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            name: {"model": p.model, "base_url": p.client.base_url, "enabled": p.enabled, **p.health.snapshot()}
+            for name, p in self._providers.items()
+        }
+
+    async def aclose(self) -> None:
+        for provider in self._providers.values():
+            await provider.client.aclose()
+
+
+def _parse_routes(spec: str) -> Dict[str, str]:
+    routes = {}
+    for part in spec.split(","):
+        intent, sep, name = part.partition("=")
+        if sep and intent.strip() and name.strip():
+            routes[intent.strip()] = name.strip()
+    return routes
+
+
+def build_registry() -> ProviderRegistry:
+    """Registry from config: the built-in ``openai`` provider plus ``LLM_PROVIDERS``."""
+    cassette = open_cassette()
+    registry = ProviderRegistry(LLM_PROVIDER, _parse_routes(LLM_INTENT_PROVIDERS), cassette)
+    registry.register(Provider("openai", OpenAICompatibleClient(
+        api_key=OPENAI_API_KEY,
+        model=LLM_MODEL,
+        base_url=OPENAI_BASE_URL or None,
+        cassette=cassette,
+    )))
+
+    try:
+        extra = json.loads(LLM_PROVIDERS) if LLM_PROVIDERS else {}
+    except ValueError as e:
+        logger.error(f"Ignoring invalid LLM_PROVIDERS: {e}")
+        extra = {}
+    for name, spec in extra.items():
+        if not isinstance(spec, dict) or not spec.get("base_url") or not spec.get("model"):
+            logger.error(f"Ignoring LLM provider {name!r}: base_url and model are required")
+            continue
+        registry.register(Provider(name, OpenAICompatibleClient(
+            # Local servers rarely check the key, but the SDK requires one
+            api_key=spec.get("api_key") or "local",
+            model=spec["model"],
+            base_url=spec["base_url"],
+            timeout_s=float(spec.get("timeout_s", 10.0)),
+            max_tokens=int(spec.get("max_tokens", 400)),
+            max_concurrency=int(spec.get("max_concurrency", LLM_MAX_CONCURRENCY)),
+            cassette=cassette,
+        )))
+
+    for intent, name in registry.routes.items():
+        if registry.get(name) is None:
+            logger.warning(f"LLM route {intent}={name} points to an unknown provider; using {registry.default}")
+    return registry
@@ -0,0 +1,230 @@
+"""
+Near-Duplicate Reply Cache
+==========================
+
+Reuses LLM replies for questions asked in slightly different words
+("is this link safe?" / "is this url safe"), fully offline.
+
+- Normalization: lowercase, punctuation stripped, common synonyms folded
+  (url/link/website -> link, e-mail/mail -> email...).
+- Similarity: character 3-gram shingles, MinHash signatures and an LSH
+  band index for candidate lookup; candidates are confirmed by the exact
+  Jaccard similarity of their shingles.
+- Polarity: two messages only match when they carry the same negation /
+  polarity words ("not", "never", "unsafe", "avoid"...). "should I share
+  my password" and "should I not share my password" are near-identical
+  strings with opposite answers, so that is a miss whatever the score.
+- Bounded: LRU over ``max_entries`` with a TTL; evicted entries leave the
+  band index too. Each band bucket keeps its ``bucket_size`` newest ids,
+  so templated messages that all collide can't make lookups linear.
+
+Only meant for context-free prompts (the reply depends on the message
+alone). A lookup stays well under a millisecond.
+"""
+
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+import numpy as np
+
+_PRIME = (1 << 31) - 1
+
+_SYNONYMS = {
+    "url": "link",
+    "urls": "link",
+    "links": "link",
+    "website": "link",
+    "websites": "link",
+    "site": "link",
+    "webpage": "link",
+    "e-mail": "email",
+    "mail": "email",
+    "emails": "email",
+    "legit": "safe",
+    "legitimate": "safe",
+    "secure": "safe",
+    "ok": "safe",
+    "okay": "safe",
+    "dangerous": "malicious",
+    "harmful": "malicious",
+    "scam": "phishing",
+    "scams": "phishing",
+    "password": "pass",
+    "passwords": "pass",
+    "pwd": "pass",
+    "u": "you",
+    "r": "are",
+    "pls": "please",
+    "plz": "please",
+}
+
+_WORD = re.compile(r"[a-z0-9@.\-]+")
+_CONTRACTION = re.compile(r"n['’]t\b")
+
+_NEGATIONS = frozenset({
+    "not", "no", "never", "nor", "neither", "none", "nothing", "nobody", "without",
+    "avoid", "stop", "refuse", "block", "deny", "fake", "false", "wrong", "bad", "risky", "except",
+})
+# Antonym prefixes ("unsafe", "untrusted", "nonsecure", "disallow"...)
+_NEGATING_PREFIXES = ("un", "non", "dis")
+_NEGATING_WORDS = frozenset({"insecure", "invalid", "illegal", "illegitimate", "incorrect", "inappropriate", "improper"})
+
+
+def normalize(text: str) -> str:
+    # "don't" -> "do not": the negation must survive as its own token
+    text = _CONTRACTION.sub(" not", text.lower()).replace("cannot", "can not")
+    words = (w.strip(".-") for w in _WORD.findall(text))
+    return " ".join(_SYNONYMS.get(w, w) for w in words if w)
+
+
+def polarity(text: str) -> FrozenSet[str]:
+    """Negation / polarity words of a message; messages only match with equal sets."""
+    return frozenset(
+        w for w in normalize(text).split()
+        if w in _NEGATIONS or w in _NEGATING_WORDS or (len(w) > 4 and w.startswith(_NEGATING_PREFIXES))
+    )
+
+
+def shingles(text: str, k: int = 3) -> FrozenSet[str]:
+    norm = normalize(text)
+    if len(norm) <= k:
+        return frozenset([norm]) if norm else frozenset()
+    return frozenset(norm[i:i + k] for i in range(len(norm) - k + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateCache:
+    """
+    Similarity-keyed reply cache.
+
+    Args:
+        max_entries: Replies kept (LRU; 0 disables the cache)
+        ttl_s: Seconds an entry stays valid
+        threshold: Minimum Jaccard similarity of the normalized messages (polarity must match too)
+        bands: LSH bands
+        rows: MinHash values per band (signature length = bands * rows)
+        bucket_size: Newest ids kept per band bucket
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_s: float = 3600,
+        threshold: float = 0.9,
+        bands: int = 16,
+        rows: int = 4,
+        bucket_size: int = 16,
+        seed: int = 1,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.bucket_size = bucket_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(bands * rows, 1), dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=(bands * rows, 1), dtype=np.int64)
+
+        self._lock = threading.Lock()
+        # id -> (namespace, shingles, polarity, band keys, reply, expires_at)
+        self._entries: "OrderedDict[int, Tuple[str, FrozenSet[str], FrozenSet[str], Tuple[int, ...], str, float]]" = OrderedDict()
+        # band key -> ids in insertion order (dict as an ordered set)
+        self._buckets: Dict[int, Dict[int, None]] = {}
+        self._next_id = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _band_keys(self, namespace: str, grams: FrozenSet[str]) -> Tuple[int, ...]:
+        x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.int64, count=len(grams))
+        signature = ((self._a * x + self._b) % _PRIME).min(axis=1)
+        bands = signature.reshape(self.bands, self.rows)
+        return tuple(hash((namespace, i, band.tobytes())) for i, band in enumerate(bands))
+
+    def get(self, namespace: str, message: str) -> Optional[str]:
+        """Reply cached for a message similar to ``message`` in ``namespace``, if any."""
+        if not self.enabled:
+            return None
+        grams = shingles(message)
+        if not grams:
+            return None
+        keys = self._band_keys(namespace, grams)
+        polar = polarity(message)
+        now = time.monotonic()
+        with self._lock:
+            candidates: Set[int] = set()
+            for key in keys:
+                candidates.update(self._buckets.get(key, ()))
+            best, best_score = None, self.threshold
+            for entry_id in candidates:
+                ns, other, other_polar, _, _, expires_at = self._entries[entry_id]
+                if ns != namespace or expires_at <= now or other_polar != polar:
+                    continue
+                score = jaccard(grams, other)
+                if score >= best_score:
+                    best, best_score = entry_id, score
+            if best is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][4]
+
+    def put(self, namespace: str, message: str, reply: str) -> None:
+        if not self.enabled:
+            return
+        grams = shingles(message)
+        if not grams:
+            return
+        keys = self._band_keys(namespace, grams)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, grams, polarity(message), keys, reply, time.monotonic() + self.ttl_s)
+            for key in keys:
+                bucket = self._buckets.setdefault(key, {})
+                bucket[entry_id] = None
+                if len(bucket) > self.bucket_size:
+                    del bucket[next(iter(bucket))]
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        entry_id, (_, _, _, keys, _, _) = self._entries.popitem(last=False)
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.pop(entry_id, None)
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,244 @@
+"""
+LLM Telemetry
+=============
+
+Per-call accounting for the LLM layer, aggregated in memory.
+
+Every ``llm_explain*`` call is recorded with its intent, provider, model,
+cache status, latency and token usage. Series are keyed by
+``(intent, provider, model, cache)`` and hold counters, a fixed-bucket
+latency histogram and the estimated cost.
+
+Cache status is one of:
+
+- ``miss``: answered by the LLM
+- ``batched``: answered by the LLM as part of a micro-batch
+- ``hit`` / ``similar``: exact or near-duplicate cache
+- ``template``: template explanation, no LLM call
+- ``fallback``: LLM failed or ran out of budget (template/fallback text)
+- ``disabled``: no provider configured
+
+Token counts come from the provider's ``usage`` when it reports one
+(streams ask for it with ``include_usage``); otherwise (replayed streams,
+servers without usage) they are estimated locally and the call is counted
+under ``estimated_calls``. Costs use ``LLM_PRICES`` (USD per million
+prompt / completion tokens).
+"""
+
+import bisect
+import datetime
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import LLM_PRICES
+from app.llm.context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; a final +Inf bucket follows
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# USD per 1M tokens: (prompt, completion)
+_DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def _load_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """``{"model": {"prompt": 0.4, "completion": 1.6}}`` merged over the defaults."""
+    prices = dict(_DEFAULT_PRICES)
+    try:
+        extra = json.loads(spec) if spec else {}
+        for model, price in extra.items():
+            prices[model] = (float(price["prompt"]), float(price["completion"]))
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.error(f"Ignoring invalid LLM_PRICES: {e}")
+    return prices
+
+
+@dataclass
+class CallRecord:
+    """What one ``llm_explain*`` call did; filled in by the router and the client."""
+    intent: str = "default"
+    provider: str = ""
+    model: str = ""
+    cache: str = "miss"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    estimated: bool = False
+
+    def add_usage(self, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.estimated = self.estimated or estimated
+
+
+_CURRENT: ContextVar[Optional[CallRecord]] = ContextVar("llm_call_record", default=None)
+
+
+@contextmanager
+def collect_usage() -> Iterator[CallRecord]:
+    """Route token usage of upstream calls made inside the block to a fresh record."""
+    record = CallRecord()
+    token = _CURRENT.set(record)
+    try:
+        yield record
+    finally:
+        _reset(token)
+
+
+def _reset(token) -> None:
+    try:
+        _CURRENT.reset(token)
+    except ValueError:
+        # Async generator finalized from another context; nothing left to restore
+        pass
+
+
+def note_usage(usage: Any, messages: List[dict], text: str) -> None:
+    """
+    Add one upstream call's token usage to the current record (if any).
+
+    ``usage`` is the SDK's ``resp.usage``; when missing, tokens are estimated
+    from the prompt and reply text.
+    """
+    record = _CURRENT.get()
+    if record is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt is not None and completion is not None:
+        record.add_usage(prompt, completion)
+    else:
+        prompt_text = "\n".join(str(m.get("content", "")) for m in messages)
+        record.add_usage(count_tokens(prompt_text), count_tokens(text), estimated=True)
+
+
+class _Series:
+    __slots__ = ("calls", "prompt_tokens", "completion_tokens", "estimated_calls", "cost_usd", "latency_sum", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_calls = 0
+        self.cost_usd = 0.0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile (None past the last bound)."""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return None
+
+
+class LLMTelemetry:
+    """In-memory LLM call aggregates (per worker)."""
+
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.prices = prices if prices is not None else _load_prices(LLM_PRICES)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str, str, str], _Series] = {}
+        self._since = datetime.datetime.now().isoformat()
+
+    @contextmanager
+    def track(self, intent: Optional[str]) -> Iterator[CallRecord]:
+        """Time the block and record it; upstream token usage inside it lands on the yielded record."""
+        record = CallRecord(intent=intent or "default")
+        token = _CURRENT.set(record)
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            _reset(token)
+            self.record(record, (time.perf_counter() - t0) * 1000)
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def record(self, call: CallRecord, latency_ms: float) -> None:
+        key = (call.intent, call.provider, call.model, call.cache)
+        cost = self.cost(call.model, call.prompt_tokens, call.completion_tokens)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            series.calls += 1
+            series.prompt_tokens += call.prompt_tokens
+            series.completion_tokens += call.completion_tokens
+            series.estimated_calls += int(call.estimated)
+            series.cost_usd += cost
+            series.latency_sum += latency_ms
+            series.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+            self._since = datetime.datetime.now().isoformat()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-series aggregates (slowest total latency first) plus per-intent totals."""
+        with self._lock:
+            items = sorted(self._series.items(), key=lambda kv: kv[1].latency_sum, reverse=True)
+            series = []
+            by_intent: Dict[str, Dict[str, Any]] = {}
+            for (intent, provider, model, cache), s in items:
+                series.append({
+                    "intent": intent,
+                    "provider": provider,
+                    "model": model,
+                    "cache": cache,
+                    "calls": s.calls,
+                    "prompt_tokens": s.prompt_tokens,
+                    "completion_tokens": s.completion_tokens,
+                    "estimated_calls": s.estimated_calls,
+                    "cost_usd": round(s.cost_usd, 6),
+                    "latency_ms": {
+                        "sum": round(s.latency_sum, 1),
+                        "mean": round(s.latency_sum / s.calls, 1),
+                        "p50": s.percentile(0.5),
+                        "p95": s.percentile(0.95),
+                        "buckets": {
+                            **{str(bound): n for bound, n in zip(LATENCY_BUCKETS_MS, s.buckets)},
+                            "+Inf": s.buckets[-1],
+                        },
+                    },
+                })
+                total = by_intent.setdefault(intent, {
+                    "calls": 0, "llm_calls": 0, "latency_ms_sum": 0.0,
+                    "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+                })
+                total["calls"] += s.calls
+                if cache in ("miss", "batched"):
+                    total["llm_calls"] += s.calls
+                total["latency_ms_sum"] += s.latency_sum
+                total["prompt_tokens"] += s.prompt_tokens
+                total["completion_tokens"] += s.completion_tokens
+                total["cost_usd"] += s.cost_usd
+            for total in by_intent.values():
+                total["latency_ms_sum"] = round(total["latency_ms_sum"], 1)
+                total["cost_usd"] = round(total["cost_usd"], 6)
+            return {
+                "since": self._since,
+                "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+                "by_intent": dict(sorted(by_intent.items(), key=lambda kv: kv[1]["latency_ms_sum"], reverse=True)),
+                "series": series,
+            }
@@ -0,0 +1,96 @@
+"""
+Template Explanations
+=====================
+
+Deterministic explanations rendered straight from tool JSON.
+
+Covers the stock results of ``security_stub_scan`` (SAFE / SUSPICIOUS /
+MALICIOUS) and of the image scan (``ai_likelihood_level`` LOW / MEDIUM /
+HIGH). The text only restates the tool's own fields, so it can't invent
+indicators, and it renders in microseconds. ``llm_router`` uses it
+instead of the LLM for routine verdicts, on request (``fast``), when the
+LLM is saturated or unavailable.
+"""
+
+from typing import Any, Dict, List, Optional
+
+_VERDICT_LEAD = {
+    "SAFE": "✅ This looks safe.",
+    "SUSPICIOUS": "⚠️ This looks suspicious.",
+    "MALICIOUS": "🚨 This looks malicious.",
+}
+
+_VERDICT_ADVICE = {
+    "SAFE": "No warning signs were found, but stay alert if anything about it feels off.",
+    "SUSPICIOUS": "Some warning signs were found. Don't act on it until you've verified it.",
+    "MALICIOUS": "Several warning signs point the same way. Treat it as an attack.",
+}
+
+_LIKELIHOOD_LEAD = {
+    "LOW": "🟢 Low likelihood that this image is AI-generated or edited.",
+    "MEDIUM": "🟡 Medium likelihood that this image is AI-generated or edited.",
+    "HIGH": "🔴 High likelihood that this image is AI-generated or edited.",
+}
+
+
+def _bullets(items: List[Any]) -> str:
+    return "\n".join(f"• {item}" for item in items if item)
+
+
+def render_security(result: Dict[str, Any]) -> Optional[str]:
+    verdict = str(result.get("verdict", "")).upper()
+    if verdict not in _VERDICT_LEAD:
+        return None
+
+    lines = [
+        f"Sentri: {_VERDICT_LEAD[verdict]}",
+        f"**Risk:** {result.get('risk_level', 'UNKNOWN')} (score {result.get('risk_score', '?')}/10)",
+        _VERDICT_ADVICE[verdict],
+    ]
+    signals = result.get("signals") or []
+    if signals:
+        lines += ["", "**What we found:**", _bullets(signals)]
+    actions = [a for a in result.get("recommended_actions") or [] if a]
+    if actions:
+        lines += ["", "**Next steps:**", _bullets(actions)]
+    return "\n".join(lines)
+
+
+def render_image(result: Dict[str, Any]) -> Optional[str]:
+    assessment = result.get("assessment") or {}
+    level = str(assessment.get("ai_likelihood_level", "")).upper()
+    if level not in _LIKELIHOOD_LEAD:
+        return None
+
+    lines = [f"Sentri: {_LIKELIHOOD_LEAD[level]}"]
+    reasons = assessment.get("reasons") or []
+    if reasons:
+        lines += ["", "**Why:**", _bullets(reasons)]
+    else:
+        lines.append("No metadata or pixel-level warning signs were found.")
+    actions = assessment.get("recommended_actions") or []
+    if actions:
+        lines += ["", "**To verify:**", _bullets(actions)]
+    lines += ["", result.get("disclaimer") or "Heuristic check, not definitive proof of real/fake."]
+    return "\n".join(lines)
+
+
+def render_explanation(result: Any) -> Optional[str]:
+    """Template explanation for a known tool result, or None if it needs the LLM."""
+    if not isinstance(result, dict):
+        return None
+    if "verdict" in result:
+        return render_security(result)
+    if "assessment" in result:
+        return render_image(result)
+    return None
+
+
+def is_routine(result: Any, verdicts: frozenset) -> bool:
+    """True for results whose verdict/level is in ``verdicts`` (e.g. SAFE, LOW)."""
+    if not isinstance(result, dict):
+        return False
+    if "verdict" in result:
+        return str(result["verdict"]).upper() in verdicts
+    level = (result.get("assessment") or {}).get("ai_likelihood_level")
+    return level is not None and str(level).upper() in verdicts
@@ -1,9 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.assistant import router as assistant_router
 from app.api.media import router as media_router
+from app.api.internal import router as internal_router
+from app.agent_gateway.gateway import start_persistence, stop_persistence
+from app.llm import llm_router
+from app.tools.media.scan_engine import ENGINE as scan_engine
 
-app = FastAPI(title="Sentri Hackathon")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_persistence()
+    await scan_engine.start()
+    yield
+    await stop_persistence()
+    await llm_router.aclose()
+    await scan_engine.shutdown()
+
+app = FastAPI(title="Sentri Hackathon", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,4 +32,5 @@ def health():
     return {"status": "ok"}
 
 app.include_router(assistant_router, tags=["assistant"])
-app.include_router(media_router, tags=["media"])
\ No newline at end of file
+app.include_router(media_router, tags=["media"])
+app.include_router(internal_router, tags=["internal"])
\ No newline at end of file
@@ -1,13 +1,17 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, Literal
 
 Mode = Literal["security", "automotive"]
 
+# Client ids become file names in the file based stores; keep them short and plain
+CONVERSATION_ID_PATTERN = r"^[A-Za-z0-9_.:-]{1,128}$"
+
 class ChatRequest(BaseModel):
-    conversation_id: Optional[str] = None   # hackathon simple string id
+    conversation_id: Optional[str] = Field(None, max_length=128, pattern=CONVERSATION_ID_PATTERN)   # hackathon simple string id
     mode: Mode
     message: str
     context: Optional[Dict[str, Any]] = None
+    fast: bool = False  # template explanation instead of the LLM when possible
 
 class ChatResponse(BaseModel):
     conversation_id: str
@@ -1,58 +1,86 @@
-from typing import Dict, Any, List
+from functools import cached_property
+from typing import Dict, Any, List, Optional, Tuple
 import numpy as np
 import cv2
 from PIL import Image
 
-def _to_bgr_np(img: Image.Image) -> np.ndarray:
-    rgb = np.array(img.convert("RGB"))
-    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+# Detectors only read the capped working image (gray@512 / gray@256 are resized
+# from it), so decoders may skip full resolution. Set True if one ever needs it.
+NEEDS_FULL_DECODE = False
 
-def detect_over_smoothing(bgr: np.ndarray) -> float:
+class ImageFeatures:
+    """
+    Per-image intermediates shared by the detectors.
+
+    Each one is computed on first use and memoized, so a scan decodes,
+    converts and resizes the image once no matter how many detectors
+    read it.
+    """
+
+    def __init__(self, img: Image.Image):
+        self.img = img
+
+    @cached_property
+    def rgb(self) -> np.ndarray:
+        return np.asarray(_rgb_image(self.img))
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+
+    @cached_property
+    def gray_512(self) -> np.ndarray:
+        return cv2.resize(self.gray, (512, 512), interpolation=cv2.INTER_AREA)
+
+    @cached_property
+    def gray_256(self) -> np.ndarray:
+        # Default (bilinear) interpolation: the DCT thresholds were tuned on it
+        return cv2.resize(self.gray, (256, 256))
+
+    @cached_property
+    def fft_magnitude(self) -> np.ndarray:
+        # Log magnitude of gray@512; left unshifted since only its distribution is used
+        return np.log(np.abs(np.fft.fft2(self.gray_512)) + 1.0)
+
+def _rgb_image(img: Image.Image) -> Image.Image:
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+def detect_over_smoothing(features: ImageFeatures) -> float:
     # Low edge energy can indicate heavy smoothing (common in AI portraits)
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-    # Resize for speed
-    gray = cv2.resize(gray, (512, 512), interpolation=cv2.INTER_AREA)
-    lap = cv2.Laplacian(gray, cv2.CV_64F)
+    lap = cv2.Laplacian(features.gray_512, cv2.CV_64F)
     score = float(lap.var())  # higher = more detail, lower = smoother
     return score
 
-def detect_repeated_texture(bgr: np.ndarray) -> float:
+def detect_repeated_texture(features: ImageFeatures) -> float:
     # Simple periodicity hint via FFT magnitude peaks (very rough but explainable)
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-    # Resize for speed
-    gray = cv2.resize(gray, (512, 512), interpolation=cv2.INTER_AREA)
-    f = np.fft.fft2(gray)
-    fshift = np.fft.fftshift(f)
-    mag = np.log(np.abs(fshift) + 1.0)
     # measure "spikiness" (more spikes can hint repeated patterns)
-    return float(np.percentile(mag, 99) - np.percentile(mag, 50))
+    p99, p50 = np.percentile(features.fft_magnitude, [99, 50])
+    return float(p99 - p50)
 
-def detect_jpeg_compression_artifacts(img: Image.Image) -> float:
+def detect_jpeg_compression_artifacts(features: ImageFeatures) -> float:
     # Rough measure: if PNG with no EXIF but looks like screenshot, not suspicious by itself.
     # Here we detect blockiness-like artifact strength using DCT energy (lightweight)
-    bgr = _to_bgr_np(img)
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-    gray = cv2.resize(gray, (256, 256))
-    dct = cv2.dct(gray.astype(np.float32) / 255.0)
+    dct = cv2.dct(features.gray_256.astype(np.float32) / 255.0)
     # high frequency energy proxy
     hf = np.mean(np.abs(dct[32:, 32:]))
     return float(hf)
 
-def classify_image_type(img: Image.Image) -> str:
+def classify_image_type(img: Image.Image, size: Optional[Tuple[int, int]] = None) -> str:
     # Very simple classification for demo purposes
-    w, h = img.size
+    # size: logical size when img was decoded at reduced resolution
+    w, h = size or img.size
     if w > 1200 and h > 1200:
         return "photo_or_high_res"
     if w > 900 and h < 700:
         return "screenshot_or_banner"
     return "general_image"
 
-def run_heuristics(img: Image.Image) -> Dict[str, Any]:
-    bgr = _to_bgr_np(img)
+def run_heuristics(img: Image.Image, size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    features = ImageFeatures(img)
 
-    smooth_var = detect_over_smoothing(bgr)     # low => smoother
-    repeat_score = detect_repeated_texture(bgr) # higher => more periodicity hints
-    jpeg_hf = detect_jpeg_compression_artifacts(img)
+    smooth_var = detect_over_smoothing(features)     # low => smoother
+    repeat_score = detect_repeated_texture(features) # higher => more periodicity hints
+    jpeg_hf = detect_jpeg_compression_artifacts(features)
 
     indicators: List[str] = []
     # Thresholds are heuristic — tune for your demo set
@@ -65,7 +93,7 @@ def run_heuristics(img: Image.Image) -> Dict[str, Any]:
         indicators.append("Very low high-frequency DCT energy (could be over-smoothed or heavily compressed)")
 
     return {
-        "type_guess": classify_image_type(img),
+        "type_guess": classify_image_type(img, size),
         "scores": {
             "edge_detail_variance": round(smooth_var, 3),
             "repeat_texture_score": round(repeat_score, 3),
@@ -1,7 +1,30 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from PIL import Image
 from app.tools.media.exif_check import extract_exif
-from app.tools.media.heuristics import run_heuristics
+from app.tools.media.heuristics import NEEDS_FULL_DECODE, run_heuristics
+
+MAX_SIDE = 1600  # working resolution cap (keeps aspect ratio)
+
+def _capped_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """Size ``img.thumbnail((max_side, max_side))`` gives an image of ``size``."""
+    w, h = size
+    scale = min(1.0, max_side / w, max_side / h)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def plan_decode(img: Image.Image, need: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+    """
+    Pick the cheapest decode that still serves the detectors (call before ``load()``).
+
+    JPEGs are decoded with DCT scaling (draft mode) at the smallest 1/2,
+    1/4 or 1/8 scale that is still at least ``need``. By default that is
+    the capped working size: the DCT detector samples the working image
+    bilinearly, so decoding below it would shift its scores. Returns the
+    logical size (what the capped full-resolution image measures).
+    """
+    logical = _capped_size(img.size, MAX_SIDE)
+    if not NEEDS_FULL_DECODE and img.format == "JPEG":
+        img.draft("RGB", need or logical)
+    return logical
 
 def score_ai_likelihood(exif_result: Dict[str, Any], heur: Dict[str, Any]) -> Dict[str, Any]:
     score = 0
@@ -43,17 +66,19 @@ def scan_image(file_path: str) -> Dict[str, Any]:
     
     # ✅ Ensure file closes properly
     with Image.open(file_path) as img:
+        # ✅ Large JPEGs decode straight at reduced scale (no full-resolution pass)
+        logical_size = plan_decode(img)
         img.load()  # ✅ force decode now (catch decode errors early)
 
         # ✅ Cap resolution for speed (keeps aspect ratio)
-        img.thumbnail((1600, 1600))
+        img.thumbnail((MAX_SIDE, MAX_SIDE))
 
         t0 = time.time()
         exif_result = extract_exif(img)
         print("EXIF:", time.time() - t0)
 
         t1 = time.time()
-        heur = run_heuristics(img)
+        heur = run_heuristics(img, size=logical_size)
         print("HEUR:", time.time() - t1)
 
         likelihood = score_ai_likelihood(exif_result, heur)
@@ -0,0 +1,205 @@
+"""
+Image Scan Engine
+=================
+
+Runs ``scan_image`` off the event loop, in a pool of worker processes
+(``SCAN_EXECUTOR=process``, default) or threads (``thread``).
+
+- Processes sidestep the GIL: the Python glue between the NumPy / OpenCV
+  calls no longer serializes concurrent scans.
+- Workers are started and warmed at app startup (cv2 / numpy imported,
+  one throwaway scan so FFT / DCT / resize code paths are touched), so the
+  first real upload doesn't pay for it. OpenCV runs single-threaded inside
+  each worker; parallelism comes from the pool.
+- ``SCAN_WORKERS`` (0 = one per available core) caps concurrent scans;
+  extra scans wait their turn without counting against their timeout. A
+  slot is only freed when its scan has really stopped: a thread worker
+  that timed out (threads can't be killed) keeps its slot until it ends.
+- ``SCAN_TIMEOUT_S`` bounds each scan. A process worker stuck past it
+  (runaway decode) is killed by restarting the pool; scans that were
+  running on the old pool are retried once on the new one.
+
+Workers are fed file paths (uploads are already streamed to disk).
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from app.core.config import SCAN_EXECUTOR, SCAN_WORKERS, SCAN_TIMEOUT_S
+
+logger = logging.getLogger(__name__)
+
+
+class ScanTimeout(TimeoutError):
+    """A scan ran past ``SCAN_TIMEOUT_S``."""
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not on Linux
+        return os.cpu_count() or 1
+
+
+# ==========================================
+# Worker side
+# ==========================================
+
+def _warm_worker() -> None:
+    """Pool initializer: import the heavy modules and run one tiny scan."""
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from app.tools.media.heuristics import run_heuristics
+
+    # Parallelism comes from the pool; nested OpenCV threads would oversubscribe the cores
+    cv2.setNumThreads(1)
+    noise = np.random.default_rng(0).integers(0, 255, (600, 600, 3), dtype=np.uint8)
+    run_heuristics(Image.fromarray(noise))
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _scan(path: str) -> Dict[str, Any]:
+    from app.tools.media.image_scan import scan_image
+
+    return scan_image(path)
+
+
+# ==========================================
+# Engine
+# ==========================================
+
+def _release_slot(slots: asyncio.Semaphore, future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()  # retrieved: nobody awaits an abandoned scan
+    slots.release()
+
+
+class ScanEngine:
+    """
+    Pool of scan workers.
+
+    Args:
+        workers: Concurrent scans (0 = available cores)
+        timeout_s: Per-scan limit (0 = none)
+        executor: ``process`` or ``thread``
+    """
+
+    def __init__(self, workers: int = SCAN_WORKERS, timeout_s: float = SCAN_TIMEOUT_S, executor: str = SCAN_EXECUTOR):
+        self.workers = workers if workers > 0 else available_cores()
+        self.timeout_s = timeout_s
+        self.executor = executor if executor in ("process", "thread") else "process"
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._restart_lock: Optional[asyncio.Lock] = None
+        self._counters = {"scans": 0, "timeouts": 0, "restarts": 0, "errors": 0}
+
+    def _new_pool(self) -> Executor:
+        if self.executor == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan")
+        # forkserver: no fork of a process that already runs threads / an event loop
+        context = multiprocessing.get_context("forkserver" if os.name == "posix" else "spawn")
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_warm_worker)
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Event loop primitives belong to one loop (e.g. test clients / reloads)
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.workers)
+            self._restart_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Create the pool and wait until every worker is up and warm."""
+        self._bind_loop()
+        if self._pool is None:
+            self._pool = self._new_pool()
+        if self.executor == "process":
+            t0 = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            # One submit per worker makes the pool spawn them all now
+            await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)))
+            spawned = len(getattr(self._pool, "_processes", None) or ())
+            logger.info(f"Scan engine: {spawned} warm workers in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    async def _restart(self, broken: Executor) -> None:
+        """Kill the workers of ``broken`` and replace the pool (once per broken pool)."""
+        async with self._restart_lock:
+            if self._pool is not broken:
+                return
+            self._counters["restarts"] += 1
+            # No per-task cancel exists for a running process; killing the pool's workers is the only stop
+            for process in list(getattr(broken, "_processes", {}).values()):
+                process.kill()
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+        await self.start()
+
+    async def scan(self, path: str) -> Dict[str, Any]:
+        """
+        Scan one image file.
+
+        Raises:
+            ScanTimeout: the scan ran past ``timeout_s`` (its worker was killed)
+        """
+        self._bind_loop()
+        if self._pool is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        retried = False
+        future: Optional[asyncio.Future] = None
+        slots = self._slots
+        await slots.acquire()
+        try:
+            while True:
+                pool = self._pool
+                future = loop.run_in_executor(pool, _scan, path)
+                try:
+                    # shield: a timeout / cancelled caller must not mark a still running scan as done
+                    result = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout_s or None)
+                except asyncio.TimeoutError:
+                    self._counters["timeouts"] += 1
+                    # Threads can't be stopped: the scan finishes in the background, the caller moves on
+                    if self.executor == "process":
+                        await self._restart(pool)
+                    raise ScanTimeout(f"Image scan exceeded {self.timeout_s:g}s")
+                except BrokenProcessPool:
+                    # Another scan's timeout (or a crashed worker) took the pool down
+                    await self._restart(pool)
+                    if retried:
+                        self._counters["errors"] += 1
+                        raise
+                    retried = True
+                    continue
+                self._counters["scans"] += 1
+                return result
+        finally:
+            if future is None:
+                slots.release()
+            elif future.done():
+                _release_slot(slots, future)
+            else:
+                # Still running (thread past its timeout, cancelled caller): the slot frees when it ends
+                future.add_done_callback(functools.partial(_release_slot, slots))
+
+    async def shutdown(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"executor": self.executor, "workers": self.workers, "timeout_s": self.timeout_s, **self._counters}
+
+
+ENGINE = ScanEngine()
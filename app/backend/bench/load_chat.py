@@ -0,0 +1,305 @@
+"""
+Chat load test
+==============
+
+End-to-end load test for ``POST /assistant/chat``.
+
+The FastAPI app runs in-process (httpx ``ASGITransport``, no sockets) and
+the upstream OpenAI calls are replaced by a local stand-in with configurable
+latency, so results measure our own overhead: intent detection, tools,
+the LLM wait and persistence. With ``--cassette`` the LLM replies (and
+their latency distribution) are replayed from a recorded cassette instead
+(``--cassette-mode record`` makes live calls and records them).
+
+Each scenario seeds a fresh data dir with N stored conversations and runs
+in its own subprocess, because the gateway builds its store at import
+time. Results are printed as JSON (per scenario: p50/p95/p99 latency,
+throughput and per-stage timings from the ``Server-Timing`` header).
+
+Usage (from app/backend)::
+
+    python -m bench.load_chat --requests 2000 --concurrency 100 \\
+        --stored 0,1000,10000 --llm-latency-ms 300 --backend sqlite
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Mix of messages hitting every security intent
+MESSAGES = [
+    "Is it safe to reuse my password on two sites?",
+    "Check this link https://paypa1-verify.example.com/login urgent",
+    "Subject: Invoice overdue\nFrom: billing@example.com\nDear customer, pay immediately",
+    "failed login for admin from ip 10.0.0.7\nfailed login for admin from ip 10.0.0.7\nssh auth error",
+    "What should I do after clicking a phishing link?",
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (None for no samples)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered))))
+    return round(ordered[rank - 1], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 2) if values else None,
+        "mean": round(sum(values) / len(values), 2) if values else None,
+    }
+
+
+# ==========================================
+# Scenario (runs in a child process)
+# ==========================================
+
+def install_llm_stub(latency_ms: float, jitter_ms: float, seed: int) -> None:
+    """Replace the upstream OpenAI calls with sleeps of ``latency_ms`` +/- ``jitter_ms``."""
+    from app.llm.openai_client import OpenAICompatibleClient
+
+    rng = random.Random(seed)
+
+    def delay() -> float:
+        return max(0.0, rng.uniform(latency_ms - jitter_ms, latency_ms + jitter_ms)) / 1000
+
+    def complete(self, messages: list, params: dict) -> str:
+        time.sleep(delay())
+        return f"Sentri (bench): {messages[-1]['content'][:40]}"
+
+    async def acomplete(self, messages: list, params: dict) -> str:
+        await asyncio.sleep(delay())
+        return f"Sentri (bench): {messages[-1]['content'][:40]}"
+
+    # Only the network call is stubbed: concurrency cap, coalescing and hedging stay in the measured path
+    OpenAICompatibleClient._complete = complete
+    OpenAICompatibleClient._acomplete = acomplete
+
+
+def seed_store(count: int, messages_per_conversation: int) -> List[str]:
+    """Fill the store with ``count`` conversations; returns their ids."""
+    import datetime
+
+    from app.agent_gateway import gateway
+
+    ids = [f"bench-{i:07d}" for i in range(count)]
+    start = datetime.datetime.now() - datetime.timedelta(days=1)
+    batch = []
+    for i, cid in enumerate(ids):
+        for j in range(messages_per_conversation):
+            batch.append((cid, {
+                "role": "user" if j % 2 == 0 else "assistant",
+                "content": MESSAGES[(i + j) % len(MESSAGES)],
+                "mode": "security",
+                "timestamp": (start + datetime.timedelta(seconds=i, milliseconds=j)).isoformat(),
+            }))
+        if len(batch) >= 5000:
+            gateway._STORE.append_many(batch)
+            batch = []
+    if batch:
+        gateway._STORE.append_many(batch)
+    return ids
+
+
+async def drive(args, seeded_ids: List[str]) -> dict:
+    import httpx
+
+    from app.core.timing import parse_server_timing
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+
+    async def one(client: httpx.AsyncClient, i: int) -> None:
+        if seeded_ids and rng.random() < args.existing_ratio:
+            cid = rng.choice(seeded_ids)
+        else:
+            cid = f"load-{i:07d}"
+        body = {"mode": "security", "message": MESSAGES[i % len(MESSAGES)], "conversation_id": cid}
+        t0 = time.perf_counter()
+        try:
+            r = await client.post("/assistant/chat", json=body)
+            status = str(r.status_code)
+        except Exception as e:
+            r, status = None, type(e).__name__
+        latencies.append((time.perf_counter() - t0) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+        if r is not None:
+            for name, ms in parse_server_timing(r.headers.get("server-timing", "")).items():
+                stages.setdefault(name, []).append(ms)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            # Warm-up: imports, connections, first store touches
+            for i in range(min(args.warmup, args.requests)):
+                await one(client, -1 - i)
+            latencies.clear()
+            stages.clear()
+            statuses.clear()
+
+            t_start = time.perf_counter()
+            if args.rps:
+                # Open loop: fixed arrival rate regardless of how fast replies come back
+                tasks = []
+                for i in range(args.requests):
+                    target = t_start + i / args.rps
+                    await asyncio.sleep(max(0.0, target - time.perf_counter()))
+                    tasks.append(asyncio.create_task(one(client, i)))
+                await asyncio.gather(*tasks)
+            else:
+                # Closed loop: ``concurrency`` clients sending back-to-back
+                counter = iter(range(args.requests))
+
+                async def worker():
+                    for i in counter:
+                        await one(client, i)
+
+                await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - t_start
+
+    ok = statuses.get("200", 0)
+    result = {
+        "requests": args.requests,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in sorted(stages.items())},
+    }
+    if args.cassette:
+        from app.llm.llm_router import provider_health
+
+        # Replay misses fail their request (non-200 status); count them here too
+        result["cassette"] = provider_health()["cassette"]
+    return result
+
+
+def run_scenario(args) -> dict:
+    if not args.cassette:
+        install_llm_stub(args.llm_latency_ms, args.llm_jitter_ms, args.seed)
+    t0 = time.perf_counter()
+    seeded = seed_store(args.scenario_stored, args.seed_messages)
+    seed_s = time.perf_counter() - t0
+    result = asyncio.run(drive(args, seeded))
+    return {"stored_conversations": args.scenario_stored, "seed_s": round(seed_s, 2), **result}
+
+
+# ==========================================
+# Orchestration (parent process)
+# ==========================================
+
+def spawn_scenario(args, stored: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="sentri-bench-") as data_dir:
+        env = dict(
+            os.environ,
+            SENTRI_DATA_DIR=data_dir,
+            CONVERSATION_BACKEND=args.backend,
+            CONVERSATION_DB_PATH="",
+            CONVERSATION_RETENTION_INTERVAL_S="0",
+            # The message mix repeats, so a response cache would hide the LLM stage entirely
+            LLM_CACHE_SIZE=os.environ.get("LLM_CACHE_SIZE", "1024") if args.llm_cache else "0",
+            LLM_CACHE_DISK_PATH="",
+            LLM_SIMILAR_SIZE=os.environ.get("LLM_SIMILAR_SIZE", "2048") if args.llm_cache else "0",
+            # Any key enables the (stubbed) provider; nothing leaves the process
+            OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "bench",
+            PYTHONPATH=BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        )
+        if args.cassette:
+            env.update(
+                LLM_CASSETTE_MODE=args.cassette_mode,
+                LLM_CASSETTE_PATH=os.path.abspath(args.cassette),
+                LLM_CASSETTE_LATENCY=args.cassette_latency,
+                LLM_CASSETTE_SEED=str(args.seed),
+            )
+        cmd = [sys.executable, "-m", "bench.load_chat", "--scenario-stored", str(stored)] + child_args(args)
+        proc = subprocess.run(cmd, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"stored_conversations": stored, "error": proc.stderr.strip().splitlines()[-1:] or ["failed"]}
+        # The app may log to stdout; the result is the last line
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def child_args(args) -> List[str]:
+    return [
+        "--requests", str(args.requests),
+        "--concurrency", str(args.concurrency),
+        "--rps", str(args.rps),
+        "--llm-latency-ms", str(args.llm_latency_ms),
+        "--llm-jitter-ms", str(args.llm_jitter_ms),
+        "--seed-messages", str(args.seed_messages),
+        "--existing-ratio", str(args.existing_ratio),
+        "--warmup", str(args.warmup),
+        "--seed", str(args.seed),
+    ] + (["--cassette", args.cassette] if args.cassette else [])
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Load test POST /assistant/chat with a stubbed LLM")
+    p.add_argument("--requests", type=int, default=1000, help="Measured requests per scenario")
+    p.add_argument("--concurrency", type=int, default=50, help="Closed-loop clients (ignored with --rps)")
+    p.add_argument("--rps", type=float, default=0, help="Open-loop arrival rate (0 = closed loop)")
+    p.add_argument("--stored", default="0,1000,10000", help="Comma separated stored-conversation counts")
+    p.add_argument("--backend", default=os.getenv("CONVERSATION_BACKEND", "jsonl"), help="jsonl | sqlite | sharded")
+    p.add_argument("--llm-latency-ms", type=float, default=300)
+    p.add_argument("--llm-jitter-ms", type=float, default=100)
+    p.add_argument("--seed-messages", type=int, default=4, help="Messages per seeded conversation")
+    p.add_argument("--existing-ratio", type=float, default=0.5, help="Share of chats continuing a seeded conversation")
+    p.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache enabled")
+    p.add_argument("--cassette", help="Replay (or record) LLM calls with this cassette instead of the stand-in")
+    p.add_argument("--cassette-mode", choices=("replay", "record"), default="replay")
+    p.add_argument("--cassette-latency", choices=("off", "recorded", "sample"), default="sample",
+                   help="Replay wait: none, each entry's own latency, or drawn from all recorded latencies")
+    p.add_argument("--warmup", type=int, default=20)
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--output", help="Also write the JSON report to this file")
+    p.add_argument("--scenario-stored", type=int, help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scenario_stored is not None:
+        print(json.dumps(run_scenario(args)))
+        return
+
+    report = {
+        "config": {
+            "backend": args.backend,
+            "requests": args.requests,
+            "concurrency": None if args.rps else args.concurrency,
+            "rps": args.rps or None,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "existing_ratio": args.existing_ratio,
+            "llm_cache": args.llm_cache,
+            "cassette": args.cassette and {"path": args.cassette, "mode": args.cassette_mode, "latency": args.cassette_latency},
+        },
+        "scenarios": [spawn_scenario(args, int(n)) for n in args.stored.split(",") if n.strip()],
+    }
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+
+
+if __name__ == "__main__":
+    main()
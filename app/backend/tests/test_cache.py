@@ -0,0 +1,22 @@
+import json
+
+from app.llm.cache import cache_key
+from app.tools.security.stub import security_stub_scan
+
+EMAIL = "URGENT: your account suspended, verify now at http://example.co with your password"
+
+
+def _key(tool_result: dict) -> str:
+    return cache_key("openai", "gpt-4.1-mini", "Explain the scan result and next steps.", "", json.dumps(tool_result), 300)
+
+
+def test_repeated_scans_share_a_key():
+    keys = {_key(security_stub_scan(intent="scan_email", text=EMAIL)) for _ in range(20)}
+    assert len(keys) == 1
+
+
+def test_different_verdicts_get_different_keys():
+    malicious = security_stub_scan(intent="scan_email", text=EMAIL)
+    safe = security_stub_scan(intent="scan_email", text="lunch at noon?")
+    assert malicious["verdict"] != safe["verdict"]
+    assert _key(malicious) != _key(safe)
@@ -0,0 +1,30 @@
+from app.llm.similarity import NearDuplicateCache
+
+
+def _cache_with(message: str, reply: str = "cached reply") -> NearDuplicateCache:
+    cache = NearDuplicateCache(max_entries=16)
+    cache.put("ns", message, reply)
+    return cache
+
+
+def test_paraphrase_hits():
+    cache = _cache_with("is this link safe?")
+    assert cache.get("ns", "is this url safe") == "cached reply"
+
+
+def test_opposite_polarity_misses():
+    pairs = [
+        ("should I share my password with IT support?", "should I not share my password with IT support?"),
+        ("should I share my password with IT support?", "shouldn't I share my password with IT support?"),
+        ("should I share my password with IT support?", "should I never share my password with IT support?"),
+        ("is it safe to click this link?", "is it unsafe to click this link?"),
+        ("is this connection secure?", "is this connection insecure?"),
+    ]
+    for cached, asked in pairs:
+        assert _cache_with(cached).get("ns", asked) is None, asked
+        assert _cache_with(asked).get("ns", cached) is None, cached
+
+
+def test_other_namespace_misses():
+    cache = _cache_with("is this link safe?")
+    assert cache.get("other", "is this link safe?") is None
@@ -7,14 +7,19 @@ export async function sendChatMessage(
   message: string,
   mode: Mode,
   conversationId?: string,
-  context?: Record<string, any>
+  context?: Record<string, any>,
+  idempotencyKey?: string
 ): Promise<ChatResponse> {
   // If we are in demo mode (no backend), we could mock.
   // But for hackathon, we assume backend is running.
 
   const res = await fetch(`${API_BASE}/assistant/chat`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: {
+      'Content-Type': 'application/json',
+      // Reuse the same key when retrying so the backend answers only once
+      ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
+    },
     body: JSON.stringify({
       message,
       mode,
@@ -30,6 +35,48 @@ export async function sendChatMessage(
   return res.json();
 }
 
+export type ChatStreamEvent =
+  | { event: 'tool'; data: Omit<ChatResponse, 'reply'> }
+  | { event: 'token'; data: { text: string } }
+  | { event: 'done'; data: ChatResponse };
+
+// Server-Sent Events over POST: tool result first, then reply tokens, then the full reply
+export async function streamChatMessage(
+  message: string,
+  mode: Mode,
+  onEvent: (e: ChatStreamEvent) => void,
+  conversationId?: string,
+  context?: Record<string, any>
+): Promise<void> {
+  const res = await fetch(`${API_BASE}/assistant/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ message, mode, conversation_id: conversationId, context }),
+  });
+  if (!res.ok || !res.body) {
+    throw new Error('Failed to send message');
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buf.indexOf('\n\n')) >= 0) {
+      const block = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      const event = block.match(/^event: (.*)$/m)?.[1];
+      const data = block.match(/^data: (.*)$/m)?.[1];
+      if (event && data) {
+        onEvent({ event, data: JSON.parse(data) } as ChatStreamEvent);
+      }
+    }
+  }
+}
+
 export async function getHealth(): Promise<{ status: string }> {
   const res = await fetch(`${API_BASE}/health`);
   return res.json();
@@ -49,14 +96,31 @@ export interface ConversationSummary {
   message_count: number;
 }
 
-export async function getHistory(): Promise<{ conversations: ConversationSummary[] }> {
-  const res = await fetch(`${API_BASE}/assistant/history`);
+export interface HistoryPage {
+  conversations: ConversationSummary[];
+  next_cursor: string | null;
+}
+
+export async function getHistory(
+  params: { limit?: number; before?: string; mode?: Mode } = {}
+): Promise<HistoryPage> {
+  const query = new URLSearchParams();
+  if (params.limit) query.set('limit', String(params.limit));
+  if (params.before) query.set('before', params.before);
+  if (params.mode) query.set('mode', params.mode);
+  const qs = query.toString();
+  const res = await fetch(`${API_BASE}/assistant/history${qs ? `?${qs}` : ''}`);
   if (!res.ok) throw new Error('Failed to fetch history');
   return res.json();
 }
 
-export async function getConversation(cid: string): Promise<{ messages: any[] }> {
-  const res = await fetch(`${API_BASE}/assistant/history/${cid}`);
+// Pass the previous `version` as `since` to receive only new messages
+export async function getConversation(
+  cid: string,
+  since?: number
+): Promise<{ messages: any[]; version: number }> {
+  const qs = since !== undefined ? `?since=${since}` : '';
+  const res = await fetch(`${API_BASE}/assistant/history/${cid}${qs}`);
   if (!res.ok) throw new Error('Failed to fetch conversation');
   return res.json();
 }
@@ -15,6 +15,7 @@ export interface ChatRequest {
   mode: Mode;
   message: string;
   context?: Record<string, unknown>;
+  fast?: boolean;
 }
 
 export interface ChatResponse {